@@ -0,0 +1,287 @@
+import base64
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from email_scraper.script import JOB_KEYWORDS, JOB_RELATED_KEYWORDS
+
+COMPANIES = ["acme", "globex", "initech", "umbrella", "hooli", "stark industries", "wayne enterprises"]
+ROLES = ["software engineer", "data analyst", "product designer", "backend developer", "qa engineer"]
+NOISE_SUBJECTS = [
+    "your weekly digest", "order shipped", "receipt for your purchase", "flight itinerary",
+    "new sign-in to your account", "photos from the weekend", "newsletter: spring sale",
+    "your statement is ready", "reminder: dentist appointment", "package delivered",
+]
+NOISE_SNIPPETS = [
+    "thanks for shopping with us, here is a summary of what you bought",
+    "we noticed a new login from a device we don't recognise",
+    "here are this week's top stories picked for you",
+    "your package was left at the front door",
+    "see what's new this month in our store",
+]
+FILLER_HEADERS = ["Received", "DKIM-Signature", "ARC-Seal", "Return-Path", "X-Google-Smtp-Source"]
+DEFAULT_END = datetime(2026, 1, 1)
+
+
+def generate_mailbox(size=1000, job_ratio=0.3, seed=0, end=DEFAULT_END, spacing_minutes=37, body_bytes=4000,
+                     hidden_ratio=0.5):
+    # deterministic synthetic mailbox, newest message first.
+    # every message is a full-format gmail resource plus a historyId. hidden_ratio of the
+    # generic job mails only name their real category in the body, past the snippet
+    rng = random.Random(seed)
+    categories = [c for c in JOB_KEYWORDS if c != "other"]
+    messages = []
+
+    for i in range(size):
+        received = end - timedelta(minutes=spacing_minutes * i)
+        company = rng.choice(COMPANIES)
+        body_note = None
+
+        if rng.random() < job_ratio:
+            category = rng.choice(categories + ["other"])
+            role = rng.choice(ROLES)
+            if category == "other":
+                subject = f"{rng.choice(JOB_RELATED_KEYWORDS)} update from {company}"
+                snippet = f"hi there, a quick note about the {role} {rng.choice(JOB_RELATED_KEYWORDS)}"
+                if rng.random() < hidden_ratio:
+                    hidden = rng.choice(categories)
+                    body_note = f"{rng.choice(JOB_KEYWORDS[hidden])}, full details below."
+            else:
+                keyword = rng.choice(JOB_KEYWORDS[category])
+                subject = f"{keyword} - {role} at {company}"
+                snippet = f"regarding your application for the {role} position: {keyword}"
+            sender = f"{company} recruiting <jobs@{company.replace(' ', '')}.com>"
+        else:
+            subject = rng.choice(NOISE_SUBJECTS)
+            snippet = rng.choice(NOISE_SNIPPETS)
+            sender = f"{company} <noreply@{company.replace(' ', '')}.com>"
+
+        message_id = f"{0x18c0000000 + size - i:x}"
+        body = (snippet + " ") * (body_bytes // (len(snippet) + 1) + 1)
+        if body_note:
+            body = f"{snippet} {body_note} {body}"
+        headers = [
+            {"name": "Subject", "value": subject},
+            {"name": "From", "value": sender},
+            {"name": "To", "value": "me@example.com"},
+            {"name": "Date", "value": received.strftime("%a, %d %b %Y %H:%M:%S +0000")},
+        ] + [{"name": name, "value": f"{name.lower()}-{message_id}-" + "x" * 120} for name in FILLER_HEADERS]
+
+        messages.append({
+            "id": message_id,
+            "threadId": message_id,
+            "labelIds": ["INBOX"],
+            "snippet": snippet,
+            "historyId": str(1_000_000 + size - i),
+            "internalDate": str(int(received.timestamp() * 1000)),
+            "sizeEstimate": body_bytes + 2000,
+            "payload": {
+                "mimeType": "text/plain",
+                "headers": headers,
+                "body": {
+                    "size": len(body),
+                    "data": base64.urlsafe_b64encode(body[:body_bytes].encode()).decode(),
+                },
+            },
+        })
+
+    return messages
+
+
+def _top_level_fields(fields):
+    # "id,payload(mimeType,parts(body/data))" -> ["id", "payload(mimeType,parts(body/data))"]
+    parts, depth, start = [], 0, 0
+    for i, char in enumerate(fields):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            parts.append(fields[start:i])
+            start = i + 1
+    parts.append(fields[start:])
+    return parts
+
+
+def http_error(status, reason="fake error"):
+    content = json.dumps({"error": {"code": status, "message": reason}}).encode()
+    return HttpError(httplib2.Response({"status": status}), content)
+
+
+class FakeRequest:
+    def __init__(self, gmail, method, kwargs):
+        self.gmail = gmail
+        self.method = method
+        self.kwargs = kwargs
+
+    def execute(self, http=None, num_retries=0):
+        self.gmail.round_trip()
+        return self.gmail.handle(self.method, self.kwargs)
+
+
+class FakeBatch:
+    def __init__(self, gmail, callback=None):
+        self.gmail = gmail
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        request_id = request_id or str(len(self.requests) + 1)
+        self.requests.append((request_id, request, callback or self.callback))
+
+    def execute(self, http=None):
+        # one round trip for the whole batch, each part answered through its callback
+        self.gmail.round_trip()
+        for request_id, request, callback in self.requests:
+            try:
+                response, error = self.gmail.handle(request.method, request.kwargs), None
+            except HttpError as e:
+                response, error = None, e
+            if callback:
+                callback(request_id, response, error)
+
+
+class _Resource:
+    def __init__(self, gmail, prefix):
+        self.gmail = gmail
+        self.prefix = prefix
+
+    def __getattr__(self, name):
+        def method(**kwargs):
+            return FakeRequest(self.gmail, f"{self.prefix}.{name}", kwargs)
+        return method
+
+
+class FakeUsers:
+    def __init__(self, gmail):
+        self.gmail = gmail
+
+    def messages(self):
+        return _Resource(self.gmail, "messages")
+
+    def history(self):
+        return _Resource(self.gmail, "history")
+
+    def getProfile(self, **kwargs):
+        return FakeRequest(self.gmail, "getProfile", kwargs)
+
+
+class FakeGmailService:
+    # in-process stand in for the googleapiclient gmail service. it's thread safe,
+    # so one instance can be handed to every GmailManager worker via service_factory
+    def __init__(self, messages, latency=0.0, error_rate=0.0, seed=0, min_history_id=None):
+        self.messages = messages
+        self.by_id = {m["id"]: m for m in messages}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.min_history_id = min_history_id or min((int(m["historyId"]) for m in messages), default=1)
+        self.lock = threading.Lock()
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.counters = {"round_trips": 0, "calls": {}, "bytes": 0}
+
+    def users(self):
+        return FakeUsers(self)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+    def round_trip(self):
+        with self.lock:
+            self.counters["round_trips"] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def handle(self, method, kwargs):
+        with self.lock:
+            calls = self.counters["calls"]
+            calls[method] = calls.get(method, 0) + 1
+            fail = self.error_rate and self.rng.random() < self.error_rate
+        if fail:
+            raise http_error(429, "rateLimitExceeded")
+
+        response = getattr(self, "_" + method.replace(".", "_"))(**kwargs)
+        size = len(json.dumps(response))
+        with self.lock:
+            self.counters["bytes"] += size
+        return response
+
+    def _getProfile(self, userId="me"):
+        latest = max((int(m["historyId"]) for m in self.messages), default=self.min_history_id)
+        return {"emailAddress": "bench@example.com", "historyId": str(latest), "messagesTotal": len(self.messages)}
+
+    def _matching(self, q):
+        # understands the after:/before: date terms the manager sends, ignores the rest
+        after = before = None
+        for term in (q or "").split():
+            if term.startswith("after:"):
+                after = datetime.strptime(term[len("after:"):], "%Y/%m/%d").timestamp() * 1000
+            elif term.startswith("before:"):
+                before = datetime.strptime(term[len("before:"):], "%Y/%m/%d").timestamp() * 1000
+
+        for message in self.messages:
+            received = int(message["internalDate"])
+            if after is not None and received < after:
+                continue
+            if before is not None and received >= before:
+                continue
+            yield message
+
+    def _messages_list(self, userId="me", q=None, maxResults=100, pageToken=None, **kwargs):
+        offset = int(pageToken or 0)
+        matching = list(self._matching(q))
+        page = matching[offset:offset + maxResults]
+        response = {
+            "messages": [{"id": m["id"], "threadId": m["threadId"]} for m in page],
+            "resultSizeEstimate": len(matching),
+        }
+        if offset + maxResults < len(matching):
+            response["nextPageToken"] = str(offset + maxResults)
+        return response
+
+    def _messages_get(self, userId="me", id=None, format="full", metadataHeaders=None, fields=None):
+        message = self.by_id.get(id)
+        if message is None:
+            raise http_error(404, "Requested entity was not found.")
+
+        message = dict(message)
+        if format == "metadata":
+            wanted = {h.lower() for h in (metadataHeaders or [])}
+            headers = message["payload"]["headers"]
+            if wanted:
+                headers = [h for h in headers if h["name"].lower() in wanted]
+            message["payload"] = {"mimeType": message["payload"]["mimeType"], "headers": headers}
+
+        if fields:
+            keep = {field.split("/")[0].split("(")[0] for field in _top_level_fields(fields)}
+            message = {k: v for k, v in message.items() if k in keep}
+        return message
+
+    def _history_list(self, userId="me", startHistoryId=None, historyTypes=None, maxResults=100, pageToken=None):
+        start = int(startHistoryId)
+        if start < self.min_history_id:
+            raise http_error(404, "Requested entity was not found.")
+
+        added = sorted(
+            (m for m in self.messages if int(m["historyId"]) > start),
+            key=lambda m: int(m["historyId"]),
+        )
+        offset = int(pageToken or 0)
+        page = added[offset:offset + maxResults]
+        response = {
+            "history": [
+                {"id": m["historyId"], "messagesAdded": [{"message": {"id": m["id"], "threadId": m["threadId"]}}]}
+                for m in page
+            ],
+            "historyId": self._getProfile()["historyId"],
+        }
+        if offset + maxResults < len(added):
+            response["nextPageToken"] = str(offset + maxResults)
+        return response
@@ -0,0 +1,213 @@
+import argparse
+import contextlib
+import json
+import sys
+import time
+import uuid
+from datetime import datetime
+
+from benchmarks.fake_gmail import FakeGmailService, generate_mailbox
+from email_scraper.script import (
+    CLASSIFIER,
+    GMAIL_QUOTA_UNITS_PER_SECOND,
+    JOB_KEYWORDS,
+    JOB_RELATED_KEYWORDS,
+    GmailManager,
+)
+
+UNTHROTTLED_QUOTA = 1e9  # the fake has no quota, only --respect-quota turns the limiter back on
+CLASSIFY_REPEATS = 5
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def naive_classify(subject, snippet):
+    # the nested any() scan fetch_emails used before KeywordClassifier, kept as a baseline
+    text = f"{subject.lower()} {snippet.lower()}"
+    if not any(k.lower() in text for k in JOB_RELATED_KEYWORDS):
+        return None
+    for category, keywords in JOB_KEYWORDS.items():
+        if category != "other" and any(k.lower() in text for k in keywords):
+            return category
+    return "other"
+
+
+def make_manager(service, quota, **kwargs):
+    gmail = GmailManager(
+        cache=False,
+        service_factory=lambda: service,
+        quota_per_second=quota,
+        **kwargs,
+    )
+    gmail.service = service
+    return gmail
+
+
+def window_days(messages):
+    oldest = datetime.fromtimestamp(int(messages[-1]["internalDate"]) / 1000)
+    return (datetime.now() - oldest).days + 1
+
+
+def bench_classification(messages):
+    items = [
+        (next(h["value"] for h in m["payload"]["headers"] if h["name"] == "Subject"), m["snippet"])
+        for m in messages
+    ]
+    # best of a few passes, a single one is mostly noise from gc and the cpu clock
+    naive = min(timed(lambda: [naive_classify(s, sn) for s, sn in items])[1] for _ in range(CLASSIFY_REPEATS))
+    compiled = min(timed(lambda: CLASSIFIER.classify_many(items))[1] for _ in range(CLASSIFY_REPEATS))
+    results = CLASSIFIER.classify_many(items)
+    return {
+        "messages": len(items),
+        "job_related": sum(1 for r in results if r.label is not None),
+        "naive_seconds": round(naive, 4),
+        "compiled_seconds": round(compiled, 4),
+        "naive_per_second": round(len(items) / naive),
+        "compiled_per_second": round(len(items) / compiled),
+    }
+
+
+def bench_listing(messages, latency, quota):
+    results = {}
+    for page_size in (100, 500):
+        service = FakeGmailService(messages, latency=latency)
+        gmail = make_manager(service, quota)
+        ids, seconds = timed(lambda: list(gmail.iter_message_ids("", page_size=page_size)))
+        results[f"page_size_{page_size}"] = {
+            "listed": len(ids),
+            "seconds": round(seconds, 4),
+            "round_trips": service.counters["round_trips"],
+        }
+    return results
+
+
+def bench_fetching(messages, latency, quota, workers):
+    days = window_days(messages)
+    results = {}
+
+    # one messages().get().execute() per id, what fetch_emails did originally
+    service = FakeGmailService(messages, latency=latency)
+    gmail = make_manager(service, quota, fetch_format="full")
+    ids = list(gmail.iter_message_ids(""))
+    service.reset_counters()
+    _, seconds = timed(lambda: [gmail._message_request(m).execute() for m in ids])
+    results["sequential_full"] = {
+        "fetched": len(ids),
+        "seconds": round(seconds, 4),
+        "round_trips": service.counters["round_trips"],
+        "bytes": service.counters["bytes"],
+    }
+
+    configs = {
+        "batched_full": {"fetch_format": "full"},
+        # metadata only classification, what ran before the body pass existed
+        "batched_metadata_no_body": {"fetch_format": "metadata", "body_classify": False},
+        "batched_metadata": {"fetch_format": "metadata"},
+        f"batched_metadata_{workers}_workers": {"fetch_format": "metadata", "workers": workers},
+    }
+    for name, kwargs in configs.items():
+        service = FakeGmailService(messages, latency=latency)
+        gmail = make_manager(service, quota, **kwargs)
+        emails, seconds = timed(lambda: gmail.fetch_emails(days=days, page_size=500))
+        gmail.close()
+        results[name] = {
+            "fetched": gmail.sync_counts["fetched"],
+            "classified": len(emails),
+            "generic": sum(1 for e in emails if e["label"] == CLASSIFIER.default_label),
+            "bodies": gmail.sync_counts["bodies"],
+            "refined": gmail.sync_counts["refined"],
+            "seconds": round(seconds, 4),
+            "round_trips": service.counters["round_trips"],
+            "bytes": service.counters["bytes"],
+        }
+    return results
+
+
+def bench_database(messages, rows):
+    # writes to whatever DB_* points at, every row is tagged and removed afterwards
+    from email_scraper.database import DatabaseManager
+
+    tag = f"bench-{uuid.uuid4().hex[:8]}"
+    emails = []
+    for i, message in enumerate((messages * (rows // len(messages) + 1))[:rows]):
+        headers = {h["name"]: h["value"] for h in message["payload"]["headers"]}
+        emails.append({
+            "subject": f"{headers['Subject']} #{i}",
+            "sender": headers["From"],
+            "received_date": datetime.fromtimestamp(int(message["internalDate"]) / 1000),
+            "label": "other",
+            "message_id": f"{tag}-{i}",
+            "snippet": message["snippet"],
+        })
+
+    half = len(emails) // 2
+    db = DatabaseManager()
+    try:
+        _, single = timed(lambda: [
+            db.insert_email(e["subject"], e["sender"], e["received_date"], e["label"], e["message_id"], e["snippet"])
+            for e in emails[:half]
+        ])
+        (inserted, _), bulk = timed(lambda: db.insert_emails_bulk(emails[half:]))
+        # the second pass is all duplicates
+        (_, skipped), bulk_dupes = timed(lambda: db.insert_emails_bulk(emails[half:]))
+    finally:
+        with db.cursor() as cur:
+            cur.execute("DELETE FROM job_emails WHERE message_id LIKE %s", (f"{tag}-%",))
+        db.close()
+
+    return {
+        "insert_email_rows": half,
+        "insert_email_seconds": round(single, 4),
+        "insert_email_per_second": round(half / single) if single else None,
+        "bulk_rows": inserted,
+        "bulk_seconds": round(bulk, 4),
+        "bulk_per_second": round(inserted / bulk) if bulk else None,
+        "bulk_duplicate_rows": len(skipped),
+        "bulk_duplicate_seconds": round(bulk_dupes, 4),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="benchmarks.run", description="sync pipeline benchmarks")
+    parser.add_argument("--size", type=int, default=2000, help="messages in the synthetic mailbox")
+    parser.add_argument("--job-ratio", type=float, default=0.3, help="fraction of job related messages")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per fake http round trip")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--respect-quota", action="store_true", help="keep the 250 units/s gmail limiter on")
+    parser.add_argument("--db", action="store_true", help="also benchmark inserts against the DB_* postgres")
+    parser.add_argument("--db-rows", type=int, default=5000)
+    parser.add_argument("--output", help="write the json report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    quota = GMAIL_QUOTA_UNITS_PER_SECOND if args.respect_quota else UNTHROTTLED_QUOTA
+    messages = generate_mailbox(size=args.size, job_ratio=args.job_ratio, seed=args.seed)
+
+    report = {
+        "config": vars(args),
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "results": {},
+    }
+    # the managers print progress, keep stdout for the report
+    with contextlib.redirect_stdout(sys.stderr):
+        report["results"]["classification"] = bench_classification(messages)
+        report["results"]["listing"] = bench_listing(messages, args.latency, quota)
+        report["results"]["fetching"] = bench_fetching(messages, args.latency, quota, args.workers)
+        if args.db:
+            report["results"]["database"] = bench_database(messages, args.db_rows)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+# modules that should only be loaded once a sync starts, never just to open the window
+DEFERRED_MODULES = [
+    "googleapiclient.discovery",
+    "google_auth_oauthlib",
+    "google.auth.transport.requests",
+    "google_auth_httplib2",
+    "httplib2",
+]
+
+# each probe runs in a fresh interpreter and prints one json object
+STARTUP_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import email_scraper.gui
+imported = time.perf_counter()
+from email_scraper.script import GmailManager
+GmailManager(cache=False)
+constructed = time.perf_counter()
+print(json.dumps({
+    "import_seconds": imported - started,
+    "manager_seconds": constructed - imported,
+    "loaded": [m for m in %r if m in sys.modules],
+}))
+"""
+
+FIRST_SYNC_PROBE = """
+import json, time
+import email_scraper.gui
+started = time.perf_counter()
+from email_scraper.google_client import build_service, discovery_document
+discovery_document()
+print(json.dumps({"google_client_seconds": time.perf_counter() - started}))
+"""
+
+
+def probe(code):
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def summarize(values):
+    return {
+        "median": round(statistics.median(values), 4),
+        "min": round(min(values), 4),
+        "max": round(max(values), 4),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="benchmarks.startup", description="time to first window benchmark")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per measurement")
+    parser.add_argument("--output", help="write the json report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    startup = [probe(STARTUP_PROBE % DEFERRED_MODULES) for _ in range(args.runs)]
+    first_sync = [probe(FIRST_SYNC_PROBE) for _ in range(args.runs)]
+
+    report = {
+        "config": vars(args),
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "results": {
+            "import_gui_seconds": summarize([r["import_seconds"] for r in startup]),
+            "gmail_manager_seconds": summarize([r["manager_seconds"] for r in startup]),
+            # paid on the first sync instead of at launch
+            "google_client_seconds": summarize([r["google_client_seconds"] for r in first_sync]),
+            "eagerly_loaded": sorted({m for r in startup for m in r["loaded"]}),
+        },
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    # the deferred google modules leaking back into startup counts as a failure
+    return 1 if report["results"]["eagerly_loaded"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
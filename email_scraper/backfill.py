@@ -0,0 +1,131 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+from email_scraper.database import BULK_INSERT_BATCH_SIZE
+from email_scraper.known_ids import KnownMessageIds
+from email_scraper.metrics import METRICS
+from email_scraper.sync import _until_cancelled
+
+BACKFILL_WINDOW_DAYS = 30
+BACKFILL_PARALLEL = 4
+
+
+def backfill_windows(since, until, window_days=BACKFILL_WINDOW_DAYS):
+    # [start, end) date ranges covering since..until, newest first. they're aligned on
+    # `since` so a resumed run with a later `until` still matches the recorded windows
+    windows = []
+    start = since
+    while start < until:
+        end = min(start + timedelta(days=window_days), until)
+        windows.append((start, end))
+        start = end
+    return windows[::-1]
+
+
+def run_backfill(
+    gmail,
+    db,
+    since,
+    until=None,
+    window_days=BACKFILL_WINDOW_DAYS,
+    parallel=BACKFILL_PARALLEL,
+    batch_size=BULK_INSERT_BATCH_SIZE,
+    on_progress=None,
+    cancel_event=None,
+):
+    # imports since..until one date window at a time, `parallel` windows at once. each
+    # finished window is recorded in backfill_windows, so rerunning after a crash or
+    # ctrl-c only redoes the windows that didn't finish. on_progress gets a dict per window
+    started = time.monotonic()
+    METRICS.reset()
+    gmail.reset_sync_counts()
+    gmail.refresh_profile()
+    cancel_event = cancel_event or threading.Event()
+
+    until = until or date.today() + timedelta(days=1)
+    windows = backfill_windows(since, until, window_days)
+    done = db.get_backfill_windows(gmail.account)
+    pending = [w for w in windows if w not in done]
+
+    progress = {
+        "account": gmail.account,
+        "windows": len(windows),
+        "resumed": len(windows) - len(pending),
+        "completed": 0,
+        "failed": 0,
+        "inserted": 0,
+        "duplicates": 0,
+    }
+    failed = []
+
+    with METRICS.span("sync.load_known_ids"):
+        gmail.known_ids = KnownMessageIds.load(db)
+    gmail.cancel_event = cancel_event
+
+    def import_window(window):
+        # a get that still fails after its retries (anything but a 404) raises out of
+        # here, so the window lands in `failed` and is never recorded as done
+        emails = _until_cancelled(gmail.iter_range_emails(*window), cancel_event)
+        with METRICS.span("backfill.window"):
+            inserted, skipped = db.insert_emails_bulk(
+                emails, batch_size=batch_size, on_stored=gmail.known_ids.add_many
+            )
+        # a window cut short by a cancel isn't recorded, the next run redoes it
+        if not cancel_event.is_set():
+            db.save_backfill_window(gmail.account, window[0], window[1], inserted, len(skipped))
+        return inserted, len(skipped)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, parallel))
+    try:
+        futures = {pool.submit(import_window, window): window for window in pending}
+        for future in as_completed(futures):
+            window = futures[future]
+            try:
+                inserted, duplicates = future.result()
+            except Exception as e:
+                # the rest keep going, a rerun picks this one up again
+                print(f"(+_+) backfill window {window[0]}..{window[1]} failed: {e}")
+                failed.append({"window": [window[0].isoformat(), window[1].isoformat()], "error": str(e)})
+                progress["failed"] += 1
+            else:
+                progress["completed"] += 1
+                progress["inserted"] += inserted
+                progress["duplicates"] += duplicates
+
+            if on_progress:
+                on_progress(dict(
+                    progress,
+                    window=[window[0].isoformat(), window[1].isoformat()],
+                    **_eta(progress, len(pending), time.monotonic() - started),
+                ))
+    except KeyboardInterrupt:
+        # let the running windows stop at their next email, they won't be marked done
+        cancel_event.set()
+        raise
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        gmail.known_ids = None
+        gmail.cancel_event = None
+
+    return dict(
+        progress,
+        listed=gmail.sync_counts["listed"],
+        known=gmail.sync_counts["known"],
+        fetched=gmail.sync_counts["fetched"],
+        cancelled=cancel_event.is_set(),
+        failed_windows=failed,
+        duration=round(time.monotonic() - started, 3),
+        metrics=METRICS.report(),
+    )
+
+
+def _eta(progress, pending, elapsed):
+    finished = progress["completed"] + progress["failed"]
+    remaining = pending - finished
+    eta = elapsed / finished * remaining if finished else None
+    return {
+        "percent": round(100 * (progress["resumed"] + finished) / progress["windows"], 1) if progress["windows"] else 100.0,
+        "elapsed": round(elapsed, 1),
+        "eta_seconds": round(eta, 1) if eta is not None else None,
+    }
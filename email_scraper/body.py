@@ -0,0 +1,102 @@
+import base64
+import codecs
+from html.parser import HTMLParser
+
+BODY_TEXT_LIMIT = 20_000  # characters of body text handed to the classifier
+BODY_BYTES_LIMIT = 200_000  # raw part bytes decoded at most, markup included
+DECODE_CHUNK = 16_384  # base64 characters decoded per step, a multiple of 4
+
+# just enough of a format=full message to find the text parts, three levels of nesting
+# covers multipart/mixed > multipart/alternative > text/*
+BODY_FIELDS = (
+    "id,payload(mimeType,body/data,"
+    "parts(mimeType,body/data,parts(mimeType,body/data,parts(mimeType,body/data))))"
+)
+
+
+class _TextExtractor(HTMLParser):
+    # collects visible text, skipping script/style, until `limit` characters are in
+    def __init__(self, limit):
+        super().__init__(convert_charrefs=True)
+        self.limit = limit
+        self.parts = []
+        self.length = 0
+        self.skipping = 0
+
+    @property
+    def full(self):
+        return self.length >= self.limit
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("script", "style"):
+            self.skipping += 1
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style") and self.skipping:
+            self.skipping -= 1
+
+    def handle_data(self, data):
+        if self.skipping or self.full:
+            return
+        data = data[:self.limit - self.length]
+        self.parts.append(data)
+        self.length += len(data)
+
+    def text(self):
+        return " ".join(" ".join(self.parts).split())
+
+
+def _iter_decoded(data, byte_limit):
+    # base64url -> text a chunk at a time, never more than byte_limit bytes
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    decoded = 0
+    for start in range(0, len(data), DECODE_CHUNK):
+        chunk = data[start:start + DECODE_CHUNK]
+        raw = base64.urlsafe_b64decode(chunk + "=" * (-len(chunk) % 4))
+        raw = raw[:byte_limit - decoded]
+        decoded += len(raw)
+        yield decoder.decode(raw)
+        if decoded >= byte_limit:
+            break
+    yield decoder.decode(b"", final=True)
+
+
+def _find_part(payload, mime_type):
+    stack = [payload]
+    while stack:
+        part = stack.pop(0)
+        if part.get("mimeType") == mime_type and part.get("body", {}).get("data"):
+            return part
+        stack.extend(part.get("parts", []))
+    return None
+
+
+def has_body(payload):
+    # metadata responses and cache entries only carry headers
+    return "parts" in payload or bool(payload.get("body", {}).get("data"))
+
+
+def extract_body_text(payload, limit=BODY_TEXT_LIMIT, byte_limit=BODY_BYTES_LIMIT):
+    # the text/plain part if there is one, otherwise the text/html part with the tags
+    # stripped, capped at `limit` characters. "" when the message has neither
+    part = _find_part(payload, "text/plain")
+    if part is not None:
+        text = []
+        length = 0
+        for piece in _iter_decoded(part["body"]["data"], byte_limit):
+            text.append(piece)
+            length += len(piece)
+            if length >= limit:
+                break
+        return " ".join("".join(text)[:limit].split())
+
+    part = _find_part(payload, "text/html")
+    if part is None:
+        return ""
+
+    parser = _TextExtractor(limit)
+    for piece in _iter_decoded(part["body"]["data"], byte_limit):
+        parser.feed(piece)
+        if parser.full:
+            break
+    return parser.text()
@@ -0,0 +1,157 @@
+import json
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = "message_cache.sqlite3"
+DEFAULT_MAX_ENTRIES = 200_000
+DEFAULT_MAX_AGE_DAYS = 365
+SQLITE_MAX_VARIABLES = 900  # stay under sqlite's bound parameter limit
+EVICT_EVERY = 50  # put_many calls between eviction passes
+
+
+class MessageCache:
+    # local sqlite copy of the message metadata gmail sent us, keyed by message id.
+    # entries come back in the same shape as a format=metadata messages().get response
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES, max_age_days=DEFAULT_MAX_AGE_DAYS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400 if max_age_days else None
+        self.lock = threading.Lock()
+        self.puts = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.executescript(
+                """
+                PRAGMA journal_mode = WAL;
+                PRAGMA synchronous = NORMAL;
+
+                CREATE TABLE IF NOT EXISTS messages (
+                    message_id TEXT PRIMARY KEY,
+                    thread_id TEXT,
+                    internal_date INTEGER,
+                    snippet TEXT,
+                    headers TEXT NOT NULL,
+                    cached_at REAL NOT NULL,
+                    account TEXT
+                );
+
+                CREATE INDEX IF NOT EXISTS messages_cached_at_idx ON messages (cached_at);
+                -- iter_messages walks the cache in this order
+                CREATE INDEX IF NOT EXISTS messages_date_id_idx ON messages (internal_date, message_id);
+                """
+            )
+            # cache files from before entries knew their account
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(messages)")}
+            if "account" not in columns:
+                self.conn.execute("ALTER TABLE messages ADD COLUMN account TEXT")
+        self.evict()
+
+    @staticmethod
+    def _to_message(row):
+        message_id, thread_id, internal_date, snippet, headers = row
+        return {
+            "id": message_id,
+            "threadId": thread_id,
+            "internalDate": str(internal_date),
+            "snippet": snippet or "",
+            "payload": {"headers": json.loads(headers)},
+        }
+
+    def get_many(self, message_ids):
+        found = {}
+        ids = list(message_ids)
+        with self.lock:
+            for start in range(0, len(ids), SQLITE_MAX_VARIABLES):
+                chunk = ids[start:start + SQLITE_MAX_VARIABLES]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.conn.execute(
+                    f"""
+                    SELECT message_id, thread_id, internal_date, snippet, headers
+                    FROM messages WHERE message_id IN ({placeholders})
+                    """,
+                    chunk,
+                )
+                for row in rows:
+                    found[row[0]] = self._to_message(row)
+        return found
+
+    def put_many(self, messages, account=None):
+        # takes {message_id: msg_data}, only the metadata fields are kept. account is the
+        # mailbox they came from, so a rebuild can file them under the right one
+        now = time.time()
+        rows = [
+            (
+                message_id,
+                msg.get("threadId"),
+                int(msg["internalDate"]),
+                msg.get("snippet", ""),
+                json.dumps(msg.get("payload", {}).get("headers", [])),
+                now,
+                account,
+            )
+            for message_id, msg in messages.items()
+        ]
+        if not rows:
+            return
+
+        with self.lock, self.conn:
+            self.conn.executemany(
+                """
+                INSERT OR REPLACE INTO messages
+                (message_id, thread_id, internal_date, snippet, headers, cached_at, account)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+
+        self.puts += 1
+        if self.puts % EVICT_EVERY == 0:
+            self.evict()
+
+    def iter_messages(self, batch_size=1000):
+        # everything in the cache as (account, message) pairs, oldest mail first, for
+        # offline reprocessing. account is None for entries cached before it was stored
+        last = ("", -1)
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    """
+                    SELECT message_id, thread_id, internal_date, snippet, headers, account
+                    FROM messages
+                    WHERE (internal_date, message_id) > (?, ?)
+                    ORDER BY internal_date, message_id
+                    LIMIT ?
+                    """,
+                    (last[1], last[0], batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield row[5], self._to_message(row[:5])
+            last = (rows[-1][0], rows[-1][2])
+
+    def evict(self):
+        # drops entries past max_age, then the oldest ones past max_entries
+        with self.lock, self.conn:
+            if self.max_age:
+                self.conn.execute("DELETE FROM messages WHERE cached_at < ?", (time.time() - self.max_age,))
+            if self.max_entries:
+                self.conn.execute(
+                    """
+                    DELETE FROM messages WHERE message_id IN (
+                        SELECT message_id FROM messages
+                        ORDER BY cached_at DESC
+                        LIMIT -1 OFFSET ?
+                    )
+                    """,
+                    (self.max_entries,),
+                )
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,41 @@
+from collections import namedtuple
+
+Classification = namedtuple("Classification", ["label", "terms"])
+
+
+class KeywordClassifier:
+    # plain substring scans, stopping at the first hit. `in` runs in C and beats one big
+    # regex over these few dozen short terms, so the only thing done up front is
+    # lowercasing the tables once instead of on every message
+    def __init__(self, job_keywords, related_keywords, default_label="other"):
+        self.default_label = default_label
+        self._related = tuple(dict.fromkeys(k.lower() for k in related_keywords))
+        # dict order is the precedence order, same as the old loop over JOB_KEYWORDS
+        self._categories = tuple(
+            (category, tuple(dict.fromkeys(k.lower() for k in keywords)))
+            for category, keywords in job_keywords.items()
+            if category != default_label
+        )
+
+    def classify_text(self, text):
+        # text must already be lowercased. terms holds the keywords that decided the label
+        for related in self._related:
+            if related in text:
+                break
+        else:
+            return Classification(None, ())
+
+        for category, keywords in self._categories:
+            for keyword in keywords:
+                if keyword in text:
+                    return Classification(category, (related, keyword))
+        return Classification(self.default_label, (related,))
+
+    def classify(self, subject, snippet=""):
+        # label is None for emails that aren't job related
+        return self.classify_text(f"{subject.lower()} {snippet.lower()}")
+
+    def classify_many(self, items):
+        # items are (subject, snippet) pairs
+        classify_text = self.classify_text
+        return [classify_text(f"{subject.lower()} {(snippet or '').lower()}") for subject, snippet in items]
@@ -0,0 +1,282 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from datetime import date
+from email_scraper.backfill import BACKFILL_PARALLEL, BACKFILL_WINDOW_DAYS, run_backfill
+from email_scraper.database import BULK_INSERT_BATCH_SIZE, RECLASSIFY_CHUNK_SIZE, DatabaseManager
+from email_scraper.metrics import METRICS, profiled
+from email_scraper.script import CLASSIFIER, GMAIL_BATCH_LIMIT, GmailManager, list_accounts
+from email_scraper.sync import run_sync, sync_accounts
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="email_scraper", description="job application email tracker")
+    commands = parser.add_subparsers(dest="command")
+
+    commands.add_parser("gui", help="open the tracker window (default)")
+
+    login = commands.add_parser("login", help="sign in to gmail and store the credentials")
+    login.add_argument("account", nargs="?", help="name to store the account under (default: token.pickle)")
+
+    commands.add_parser("accounts", help="list the named accounts with stored credentials")
+
+    sync = commands.add_parser("sync", help="sync gmail into the database without a display")
+    sync.add_argument("--days", type=int, default=30, help="date window for full scans (default 30)")
+    mode = sync.add_mutually_exclusive_group()
+    mode.add_argument("--incremental", dest="incremental", action="store_true", default=True,
+                      help="resume from the stored history checkpoint (default)")
+    mode.add_argument("--full", dest="incremental", action="store_false",
+                      help="ignore the checkpoint and scan the whole date window")
+    sync.add_argument("--workers", type=int, default=1, help="concurrent gmail fetch workers")
+    sync.add_argument("--batch-size", type=int, default=GMAIL_BATCH_LIMIT,
+                      help="messages per gmail batch request")
+    sync.add_argument("--insert-batch-size", type=int, default=BULK_INSERT_BATCH_SIZE,
+                      help="rows per database transaction")
+    sync.add_argument("--watch", action="store_true", help="keep running and sync every --interval seconds")
+    sync.add_argument("--interval", type=float, default=300, help="seconds between syncs in --watch mode")
+    accounts = sync.add_mutually_exclusive_group()
+    accounts.add_argument("--account", dest="accounts", action="append", metavar="NAME",
+                          help="sync this named account, repeat for several")
+    accounts.add_argument("--all-accounts", action="store_true", help="sync every named account")
+    sync.add_argument("--processes", type=int, help="parallel account syncs (default: one per account)")
+    sync.add_argument("--metrics-file", help="write prometheus text metrics here after every single account sync")
+    sync.add_argument("--profile", metavar="PATH",
+                      help="run one single account sync under cProfile and dump the stats to PATH ('-' prints them)")
+
+    backfill = commands.add_parser(
+        "backfill", help="import old mail window by window, resumes where an earlier run stopped"
+    )
+    backfill.add_argument("--since", type=date.fromisoformat, required=True, help="first day to import (YYYY-MM-DD)")
+    backfill.add_argument("--until", type=date.fromisoformat,
+                          help="day to stop before (YYYY-MM-DD, default tomorrow)")
+    backfill.add_argument("--window-days", type=int, default=BACKFILL_WINDOW_DAYS, help="days per date window")
+    backfill.add_argument("--parallel", type=int, default=BACKFILL_PARALLEL, help="windows imported at once")
+    backfill.add_argument("--workers", type=int, default=1, help="gmail fetch workers per window")
+    backfill.add_argument("--account", help="named account to backfill (default: token.pickle)")
+    backfill.add_argument("--insert-batch-size", type=int, default=BULK_INSERT_BATCH_SIZE,
+                          help="rows per database transaction")
+
+    rebuild = commands.add_parser(
+        "rebuild", help="re-insert every message in the local cache, no gmail calls"
+    )
+    rebuild.add_argument("--insert-batch-size", type=int, default=BULK_INSERT_BATCH_SIZE,
+                         help="rows per database transaction")
+
+    reclassify = commands.add_parser(
+        "reclassify", help="re-run the keyword classifier over stored emails"
+    )
+    reclassify.add_argument("--chunk-size", type=int, default=RECLASSIFY_CHUNK_SIZE,
+                            help="rows per read + batched update")
+
+    return parser
+
+
+def emit(summary):
+    # one json object per line on stdout, everything else goes to stderr
+    print(json.dumps(summary, default=str), file=sys.__stdout__, flush=True)
+
+
+def write_metrics(path):
+    # written to a temp file and renamed so a scraper never reads half a file
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(METRICS.prometheus())
+    os.replace(tmp, path)
+
+
+def profile_context(path):
+    if not path:
+        return contextlib.nullcontext()
+    # "-" prints the top of the profile to stderr instead of dumping a .prof file
+    return profiled(None if path == "-" else path)
+
+
+def login_command(args):
+    with contextlib.redirect_stdout(sys.stderr):
+        gmail = GmailManager(account_name=args.account, cache=False)
+        if not gmail.authenticate():
+            emit({"error": "failed to authenticate with Gmail"})
+            return 1
+        try:
+            gmail.refresh_profile()
+        finally:
+            gmail.close()
+    emit({"account_name": args.account, "account": gmail.account, "token": gmail.token_path})
+    return 0
+
+
+def accounts_command(args):
+    emit({"accounts": list_accounts()})
+    return 0
+
+
+def sync_accounts_command(args):
+    names = list_accounts() if args.all_accounts else list(dict.fromkeys(args.accounts))
+    if not names:
+        emit({"error": "no named accounts, add one with the login command"})
+        return 1
+
+    status = 0
+    try:
+        while True:
+            started = time.monotonic()
+            status = 0
+            for summary in sync_accounts(
+                names,
+                processes=args.processes,
+                days=args.days,
+                incremental=args.incremental,
+                workers=args.workers,
+                gmail_batch_size=args.batch_size,
+                batch_size=args.insert_batch_size,
+            ):
+                emit(summary)
+                if "error" in summary:
+                    status = 1
+
+            if not args.watch:
+                return status
+            time.sleep(max(0, args.interval - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        return status
+
+
+def sync_command(args):
+    if args.accounts or args.all_accounts:
+        return sync_accounts_command(args)
+
+    # the managers print progress, keep stdout clean for the summaries
+    with contextlib.redirect_stdout(sys.stderr):
+        gmail = GmailManager(batch_size=args.batch_size, workers=args.workers)
+        if not gmail.authenticate():
+            emit({"error": "failed to authenticate with Gmail"})
+            return 1
+        db = DatabaseManager(max_connections=max(2, args.workers + 1))
+
+    status = 0
+    try:
+        while True:
+            started = time.monotonic()
+            try:
+                with contextlib.redirect_stdout(sys.stderr), profile_context(args.profile):
+                    summary = run_sync(
+                        gmail,
+                        db,
+                        days=args.days,
+                        incremental=args.incremental,
+                        batch_size=args.insert_batch_size,
+                    )
+                emit(summary)
+                status = 0
+            except Exception as e:
+                emit({"error": str(e), "duration": round(time.monotonic() - started, 3)})
+                status = 1
+
+            if args.metrics_file:
+                write_metrics(args.metrics_file)
+            if not args.watch or args.profile:
+                return status
+            time.sleep(max(0, args.interval - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        return status
+    finally:
+        gmail.close()
+        db.close()
+
+
+def backfill_command(args):
+    # one json progress line per finished window, then the summary
+    with contextlib.redirect_stdout(sys.stderr):
+        gmail = GmailManager(workers=args.workers, account_name=args.account)
+        if not gmail.authenticate():
+            emit({"error": "failed to authenticate with Gmail"})
+            return 1
+        parallel = max(1, args.parallel)
+        db = DatabaseManager(max_connections=parallel + 1)
+
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            summary = run_backfill(
+                gmail,
+                db,
+                since=args.since,
+                until=args.until,
+                window_days=args.window_days,
+                parallel=parallel,
+                batch_size=args.insert_batch_size,
+                on_progress=lambda progress: emit({"progress": progress}),
+            )
+        emit(summary)
+        return 1 if summary["failed_windows"] else 0
+    except KeyboardInterrupt:
+        emit({"cancelled": True, "note": "finished windows are saved, rerun the same command to resume"})
+        return 130
+    finally:
+        gmail.close()
+        db.close()
+
+
+def rebuild_command(args):
+    started = time.monotonic()
+    with contextlib.redirect_stdout(sys.stderr):
+        gmail = GmailManager()
+        if gmail.cache is None:
+            emit({"error": "the message cache is disabled (GMAIL_CACHE_PATH is empty)"})
+            return 1
+        db = DatabaseManager()
+
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            inserted, skipped = db.insert_emails_bulk(
+                gmail.iter_cached_emails(), batch_size=args.insert_batch_size
+            )
+        emit({
+            "cached": len(gmail.cache),
+            "inserted": inserted,
+            "duplicates": len(skipped),
+            "duration": round(time.monotonic() - started, 3),
+        })
+        return 0
+    finally:
+        gmail.close()
+        db.close()
+
+
+def reclassify_command(args):
+    started = time.monotonic()
+    with contextlib.redirect_stdout(sys.stderr):
+        db = DatabaseManager()
+
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            summary = db.reclassify_emails(CLASSIFIER, chunk_size=args.chunk_size)
+        summary["duration"] = round(time.monotonic() - started, 3)
+        emit(summary)
+        return 0
+    finally:
+        db.close()
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.command == "sync":
+        return sync_command(args)
+    if args.command == "login":
+        return login_command(args)
+    if args.command == "accounts":
+        return accounts_command(args)
+    if args.command == "backfill":
+        return backfill_command(args)
+    if args.command == "rebuild":
+        return rebuild_command(args)
+    if args.command == "reclassify":
+        return reclassify_command(args)
+
+    # the gui pulls in tkinter, only import it when it's asked for
+    from email_scraper.gui import main as gui_main
+    gui_main()
+    return 0
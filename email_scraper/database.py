@@ -1,13 +1,38 @@
 import os
+import threading
+import time
+from contextlib import contextmanager
+from itertools import islice
 import psycopg2
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
 from dotenv import load_dotenv
+from email_scraper.metrics import METRICS
+from email_scraper.schema import apply_migrations
 
 load_dotenv()
 
+BULK_INSERT_BATCH_SIZE = 500
+EMAIL_PAGE_SIZE = 200
+STREAM_ITERSIZE = 2000
+SEARCH_LIMIT = 200
+RECLASSIFY_CHUNK_SIZE = 5000
+STATS_CACHE_TTL = 60
+HEALTH_CHECK_INTERVAL = 30  # seconds a pooled connection can sit idle before it's pinged
+
 
 class DatabaseManager:
-    def __init__(self):
-        self.conn = None
+    def __init__(self, min_connections=None, max_connections=None):
+        self.pool = None
+        self.min_connections = int(min_connections or os.getenv("DB_POOL_MIN", "1"))
+        self.max_connections = int(max_connections or os.getenv("DB_POOL_MAX", "10"))
+        # the pool raises instead of blocking when exhausted, so checkouts wait on this
+        self._slots = threading.BoundedSemaphore(self.max_connections)
+        self._last_used = {}
+        self._stats_cache = None
+        # bumped on every write, a stats read that overlapped one doesn't get cached
+        self._stats_generation = 0
+        self._stats_lock = threading.Lock()
         self.db_params = {
             "dbname": os.getenv("DB_NAME", "job_search_db"),
             "user": os.getenv("DB_USER", "postgres"),
@@ -19,15 +44,79 @@ class DatabaseManager:
 
     def connect(self):
         try:
-            self.conn = psycopg2.connect(**self.db_params)
+            self.pool = ThreadedConnectionPool(
+                self.min_connections, self.max_connections, **self.db_params
+            )
+            apply_migrations(self)
             print("database connected (b^_^)b ")
         except Exception as e:
             print(f"(+_+) database connection error: {e}")
             raise
 
-    def insert_email(self, subject, sender, received_date, label, message_id=None):
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        if time.monotonic() - self._last_used.get(id(conn), 0) < HEALTH_CHECK_INTERVAL:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _checkout(self):
+        # hands out a live connection, dead ones are dropped and replaced
+        while True:
+            conn = self.pool.getconn()
+            if self._is_healthy(conn):
+                return conn
+            print("ミ(ノ_ _)ノ dropping dead database connection, reconnecting")
+            self._last_used.pop(id(conn), None)
+            self.pool.putconn(conn, close=True)
+
+    @contextmanager
+    def cursor(self, name=None, itersize=STREAM_ITERSIZE):
+        # one pooled connection per operation: commit on success, rollback on error.
+        # a name makes it a server-side cursor that streams itersize rows at a time
+        with METRICS.span("db.pool_wait"):
+            self._slots.acquire()
+        conn = None
+        broken = False
+        started = time.perf_counter()
+        try:
+            with METRICS.span("db.checkout"):
+                conn = self._checkout()
+            with conn.cursor(name=name) as cur:
+                if name:
+                    cur.itersize = itersize
+                yield cur
+            conn.commit()
+            METRICS.incr("db.commits")
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            METRICS.incr("db.errors")
+            raise
+        except Exception:
+            if conn is not None and not conn.closed:
+                conn.rollback()
+            METRICS.incr("db.rollbacks")
+            raise
+        finally:
+            METRICS.observe("db.transaction", time.perf_counter() - started)
+            if conn is not None:
+                broken = broken or bool(conn.closed)
+                if broken:
+                    self._last_used.pop(id(conn), None)
+                else:
+                    self._last_used[id(conn)] = time.monotonic()
+                self.pool.putconn(conn, close=broken)
+            self._slots.release()
+
+    def insert_email(self, subject, sender, received_date, label, message_id=None, snippet=None):
         try:
-            with self.conn.cursor() as cur:
+            with self.cursor() as cur:
                 # first, try to dedupe by message_id if it exists already
                 if message_id:
                     cur.execute(
@@ -62,55 +151,221 @@ class DatabaseManager:
                 if message_id:
                     cur.execute(
                         """
-                        INSERT INTO job_emails (subject, sender, recieved_date, label, message_id)
-                        VALUES (%s, %s, %s, %s, %s)
+                        INSERT INTO job_emails (subject, sender, recieved_date, label, message_id, snippet)
+                        VALUES (%s, %s, %s, %s, %s, %s)
                         RETURNING id;
                     """,
-                        (subject, sender, received_date, label, message_id),
+                        (subject, sender, received_date, label, message_id, snippet),
                     )
                 else:
                     cur.execute(
                         """
-                        INSERT INTO job_emails (subject, sender, recieved_date, label)
-                        VALUES (%s, %s, %s, %s)
+                        INSERT INTO job_emails (subject, sender, recieved_date, label, snippet)
+                        VALUES (%s, %s, %s, %s, %s)
                         RETURNING id;
                     """,
-                        (subject, sender, received_date, label),
+                        (subject, sender, received_date, label, snippet),
                     )
-                self.conn.commit()
-                return cur.fetchone()[0]
+                new_id = cur.fetchone()[0]
+            # after the commit so nobody re-caches the old numbers in between
+            self.invalidate_statistics()
+            return new_id
         except Exception as e:
             print(f"(+_+) error inserting email: {e}")
-            self.conn.rollback()
             return None
 
-    def get_emails(self, label=None, search=None):
+    def insert_emails_bulk(self, emails, batch_size=BULK_INSERT_BATCH_SIZE, on_batch=None, on_stored=None):
+        # takes any iterable of email dicts (e.g. the GmailManager pipeline) and writes
+        # each batch_size chunk in one statement + one commit. on_batch gets the
+        # (id, subject, sender, recieved_date, label) rows of each committed chunk,
+        # on_stored the message ids now in the table (new rows and duplicates alike).
+        # returns (inserted_count, skipped_message_ids)
+        emails = iter(emails)
+        inserted = 0
+        skipped = []
 
-        try:
-            with self.conn.cursor() as cur:
-                base_query = """
-                    SELECT id, subject, sender, recieved_date, label 
-                    FROM job_emails
-                """
-                conditions = []
-                params = []
+        while True:
+            chunk = list(islice(emails, batch_size))
+            if not chunk:
+                break
+
+            rows = [
+                (
+                    e["subject"],
+                    e["sender"],
+                    e["received_date"],
+                    e["label"],
+                    e.get("message_id"),
+                    e.get("snippet"),
+                    e.get("account"),
+                    e.get("label_source", "auto"),
+                )
+                for e in chunk
+            ]
+            try:
+                with METRICS.span("db.bulk_insert"), self.cursor() as cur:
+                    # no conflict target so both the message_id and the
+                    # subject/sender/date dedupe_key unique indexes are honoured
+                    returned = execute_values(
+                        cur,
+                        """
+                        INSERT INTO job_emails (subject, sender, recieved_date, label, message_id, snippet, account, label_source)
+                        VALUES %s
+                        ON CONFLICT DO NOTHING
+                        RETURNING id, subject, sender, recieved_date, label, message_id;
+                    """,
+                        rows,
+                        page_size=len(rows),
+                        fetch=True,
+                    )
+            except Exception as e:
+                # raised so callers don't advance a sync checkpoint past lost rows
+                print(f"(+_+) error bulk inserting emails: {e}")
+                raise
+
+            if returned:
+                self.invalidate_statistics()
+            inserted += len(returned)
+            stored = {row[5] for row in returned}
+            skipped.extend(row[4] for row in rows if row[4] and row[4] not in stored)
+            METRICS.incr("db.rows_inserted", len(returned))
+            METRICS.incr("db.rows_skipped", len(rows) - len(returned))
+
+            if on_batch and returned:
+                on_batch([row[:5] for row in returned])
+            if on_stored:
+                on_stored([row[4] for row in rows if row[4]])
 
+        if skipped:
+            print(f"ミ(ノ_ _)ノ skipped {len(skipped)} duplicates")
+        return inserted, skipped
+
+    def search_emails(self, query, label=None, after=None, limit=SEARCH_LIMIT):
+        # full-text search over subject/sender/snippet, best matches first.
+        # rows are (id, subject, sender, recieved_date, label, rank, headline).
+        # keyset pagination, `after` is the (rank, recieved_date, id) of the last hit shown
+        try:
+            with self.cursor() as cur:
+                conditions = ["search_vector @@ q"]
+                # the sender is indexed unstemmed ('simple'), so the query is parsed both
+                # ways. english alone turns "google" into 'googl' and misses every sender
+                params = [query, query]
                 if label and label.lower() != "all":
                     conditions.append("label = %s")
                     params.append(label)
+                if after:
+                    # ts_rank_cd is a real, the cast keeps the comparison from rounding
+                    conditions.append("(ts_rank_cd(search_vector, q), recieved_date, id) < (%s::real, %s, %s)")
+                    params.extend(after)
+                params.append(limit)
+
+                # ts_headline is the slow part, so it only runs on the rows that made the cut
+                cur.execute(
+                    f"""
+                    SELECT id, subject, sender, recieved_date, label, rank,
+                        ts_headline(
+                            'english',
+                            coalesce(subject, '') || ' | ' || coalesce(snippet, ''),
+                            q,
+                            'StartSel=[, StopSel=], MaxFragments=2, MinWords=5, MaxWords=20'
+                        )
+                    FROM (
+                        SELECT id, subject, sender, recieved_date, label, snippet, q,
+                            ts_rank_cd(search_vector, q) AS rank
+                        FROM job_emails, (
+                            SELECT websearch_to_tsquery('english', %s) || websearch_to_tsquery('simple', %s) AS q
+                        ) terms
+                        WHERE {" AND ".join(conditions)}
+                        ORDER BY rank DESC, recieved_date DESC, id DESC
+                        LIMIT %s
+                    ) hits
+                    ORDER BY rank DESC, recieved_date DESC, id DESC;
+                """,
+                    params,
+                )
+                return cur.fetchall()
+        except Exception as e:
+            print(f"(+_+) error searching emails: {e}")
+            return []
 
-                if search:
-                    conditions.append("(subject ILIKE %s OR sender ILIKE %s)")
-                    like = f"%{search}%"
-                    params.extend([like, like])
+    def _filter_conditions(self, label=None, search=None):
+        conditions = []
+        params = []
 
-                if conditions:
-                    base_query += " WHERE " + " AND ".join(conditions)
+        if label and label.lower() != "all":
+            conditions.append("label = %s")
+            params.append(label)
 
-                base_query += " ORDER BY recieved_date DESC;"
+        if search:
+            conditions.append("(subject ILIKE %s OR sender ILIKE %s)")
+            like = f"%{search}%"
+            params.extend([like, like])
+
+        return conditions, params
+
+    def get_emails_page(self, label=None, search=None, after=None, limit=EMAIL_PAGE_SIZE):
+        # keyset pagination, `after` is the (recieved_date, id) of the last row already shown
+        try:
+            with self.cursor() as cur:
+                conditions, params = self._filter_conditions(label, search)
+                if after:
+                    conditions.append("(recieved_date, id) < (%s, %s)")
+                    params.extend(after)
+
+                query = """
+                    SELECT id, subject, sender, recieved_date, label 
+                    FROM job_emails
+                """
+                if conditions:
+                    query += " WHERE " + " AND ".join(conditions)
+                query += " ORDER BY recieved_date DESC, id DESC LIMIT %s;"
+                params.append(limit)
 
-                cur.execute(base_query, params)
+                cur.execute(query, params)
                 return cur.fetchall()
+        except Exception as e:
+            print(f"(+_+) error fetching email page: {e}")
+            return []
+
+    def iter_emails(self, label=None, search=None, itersize=STREAM_ITERSIZE):
+        # streams every matching row through a server-side cursor, itersize rows per round trip
+        conditions, params = self._filter_conditions(label, search)
+        query = """
+            SELECT id, subject, sender, recieved_date, label 
+            FROM job_emails
+        """
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY recieved_date DESC, id DESC;"
+
+        with self.cursor(name="iter_emails", itersize=itersize) as cur:
+            cur.execute(query, params)
+            yield from cur
+
+    def iter_message_ids(self, itersize=STREAM_ITERSIZE):
+        # every stored gmail message id, streamed for the sync prefilter
+        with self.cursor(name="iter_message_ids", itersize=itersize) as cur:
+            cur.execute("SELECT message_id FROM job_emails WHERE message_id IS NOT NULL;")
+            for (message_id,) in cur:
+                yield message_id
+
+    def get_stored_message_ids(self, message_ids):
+        # which of message_ids are already in job_emails, as a set
+        try:
+            with self.cursor() as cur:
+                cur.execute(
+                    "SELECT message_id FROM job_emails WHERE message_id = ANY(%s);",
+                    (list(message_ids),),
+                )
+                return {row[0] for row in cur.fetchall()}
+        except Exception as e:
+            print(f"(+_+) error checking stored message ids: {e}")
+            return set()
+
+    def get_emails(self, label=None, search=None):
+
+        try:
+            return list(self.iter_emails(label=label, search=search))
         except Exception as e:
             print(f"(+_+) error fetching filtered emails: {e}")
             return []
@@ -120,97 +375,225 @@ class DatabaseManager:
         return self.get_emails()
 
     def update_email_label(self, email_id, new_label):
+        return self.update_email_labels([email_id], new_label) is not None
+
+    def update_email_labels(self, email_ids, new_label):
+        # relabels every id in one statement + commit, returns the ids that exist (None on error)
         try:
-            with self.conn.cursor() as cur:
+            with self.cursor() as cur:
                 cur.execute(
                     """
-                    UPDATE job_emails 
-                    SET label = %s 
-                    WHERE id = %s;
+                    UPDATE job_emails
+                    SET label = %s, label_source = 'manual'
+                    WHERE id = ANY(%s)
+                    RETURNING id;
                 """,
-                    (new_label, email_id),
+                    (new_label, [int(email_id) for email_id in email_ids]),
                 )
-                self.conn.commit()
-                return True
+                updated = [row[0] for row in cur.fetchall()]
+            self.invalidate_statistics()
+            return updated
         except Exception as e:
-            print(f"(+_+) error updating email label: {e}")
-            self.conn.rollback()
-            return False
+            print(f"(+_+) error updating email labels: {e}")
+            return None
+
+    def reclassify_emails(self, classifier, chunk_size=RECLASSIFY_CHUNK_SIZE):
+        # runs stored rows back through the classifier in id order, one transaction
+        # and one batched UPDATE per chunk. labels the user set by hand or that were read
+        # from the message body are left alone, as are legacy rows stored without a
+        # snippet and rows the classifier no longer thinks are job related
+        summary = {"scanned": 0, "changed": 0, "unrelated": 0}
+        last_id = 0
+
+        while True:
+            with self.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT id, subject, snippet, label
+                    FROM job_emails
+                    WHERE id > %s AND label_source = 'auto' AND snippet IS NOT NULL
+                    ORDER BY id
+                    LIMIT %s;
+                """,
+                    (last_id, chunk_size),
+                )
+                rows = cur.fetchall()
+                if not rows:
+                    break
+
+                results = classifier.classify_many((subject or "", snippet) for _, subject, snippet, _ in rows)
+                changes = []
+                for (email_id, _, _, label), result in zip(rows, results):
+                    if result.label is None:
+                        summary["unrelated"] += 1
+                    elif result.label != label:
+                        changes.append((email_id, result.label))
+
+                if changes:
+                    execute_values(
+                        cur,
+                        """
+                        UPDATE job_emails j
+                        SET label = v.label
+                        FROM (VALUES %s) AS v(id, label)
+                        WHERE j.id = v.id AND j.label_source = 'auto' AND j.snippet IS NOT NULL;
+                    """,
+                        changes,
+                        template="(%s::integer, %s)",
+                        page_size=len(changes),
+                    )
+
+            summary["scanned"] += len(rows)
+            summary["changed"] += len(changes)
+            last_id = rows[-1][0]
+            if changes:
+                self.invalidate_statistics()
+
+        return summary
 
     def delete_email(self, email_id):
         # delete an email from the database by its ID
+        return self.delete_emails([email_id]) is not None
+
+    def delete_emails(self, email_ids):
+        # one statement + commit for the whole selection, returns the deleted ids (None on error)
         try:
-            with self.conn.cursor() as cur:
+            with self.cursor() as cur:
                 cur.execute(
                     """
-                    DELETE FROM job_emails 
-                    WHERE id = %s
+                    DELETE FROM job_emails
+                    WHERE id = ANY(%s)
+                    RETURNING id;
                 """,
-                    (email_id,),
+                    ([int(email_id) for email_id in email_ids],),
                 )
-                self.conn.commit()
-                return True
+                deleted = [row[0] for row in cur.fetchall()]
+            self.invalidate_statistics()
+            return deleted
         except Exception as e:
-            print(f"(+_+) error deleting email: {e}")
-            self.conn.rollback()
-            return False
+            print(f"(+_+) error deleting emails: {e}")
+            return None
+
+    def invalidate_statistics(self):
+        with self._stats_lock:
+            self._stats_generation += 1
+            self._stats_cache = None
 
     def get_statistics(self):
-        try:
-            with self.conn.cursor() as cur:
-                # total count
-                cur.execute("SELECT COUNT(*) FROM job_emails")
-                total_count = cur.fetchone()[0]
+        # served from the trigger-maintained email_label_counts table in one query,
+        # cached until the next write or STATS_CACHE_TTL (the 7 day window moves)
+        cached = self._stats_cache
+        if cached and time.monotonic() - cached[0] < STATS_CACHE_TTL:
+            return cached[1]
 
-                # counts by label
+        # read before the snapshot: a write that commits after it and invalidates while
+        # we're still reading would otherwise be papered over by our older numbers
+        generation = self._stats_generation
+        try:
+            with self.cursor() as cur:
+                # the recent count is a range scan on the recieved_date index
                 cur.execute(
                     """
-                    SELECT label, COUNT(*) as count 
-                    FROM job_emails 
-                    GROUP BY label 
-                    ORDER BY count DESC
+                    SELECT r.recent, c.label, c.count
+                    FROM (
+                        SELECT COUNT(*) AS recent
+                        FROM job_emails
+                        WHERE recieved_date >= NOW() - INTERVAL '7 days'
+                    ) r
+                    LEFT JOIN email_label_counts c ON c.count > 0
+                    ORDER BY c.count DESC
                 """
                 )
-                label_counts = cur.fetchall()
+                rows = cur.fetchall()
+
+            recent_count = rows[0][0]
+            label_counts = [(label or None, count) for _, label, count in rows if label is not None]
+            counts = dict(label_counts)
+            pipeline = {
+                "applications": counts.get("application", 0),
+                "interviews": counts.get("interview", 0),
+                "offers": counts.get("offer", 0),
+                "rejections": counts.get("rejection", 0),
+            }
+
+            stats = {
+                "total": sum(count for _, count in label_counts),
+                "by_label": label_counts,
+                "recent": recent_count,
+                "pipeline": pipeline,
+            }
+            with self._stats_lock:
+                if self._stats_generation == generation:
+                    self._stats_cache = (time.monotonic(), stats)
+            return stats
+        except Exception as e:
+            print(f"(+_+) error getting statistics: {e}")
+            return None
+
+    def get_sync_checkpoint(self, account):
+        state = self.get_sync_state(account)
+        return state[0] if state else None
+
+    def get_sync_state(self, account):
+        # (history_id, updated_at) of the last finished sync, or None
+        try:
+            with self.cursor() as cur:
+                cur.execute(
+                    "SELECT history_id, updated_at FROM sync_state WHERE account = %s",
+                    (account,),
+                )
+                return cur.fetchone()
+        except Exception as e:
+            print(f"(+_+) error reading sync checkpoint: {e}")
+            return None
 
-                # last 7 days
+    def save_sync_checkpoint(self, account, history_id):
+        try:
+            with self.cursor() as cur:
                 cur.execute(
                     """
-                    SELECT COUNT(*) 
-                    FROM job_emails 
-                    WHERE recieved_date >= NOW() - INTERVAL '7 days'
-                """
+                    INSERT INTO sync_state (account, history_id)
+                    VALUES (%s, %s)
+                    ON CONFLICT (account)
+                    DO UPDATE SET history_id = EXCLUDED.history_id, updated_at = NOW();
+                """,
+                    (account, history_id),
+                )
+                return True
+        except Exception as e:
+            print(f"(+_+) error saving sync checkpoint: {e}")
+            return False
+
+    def get_backfill_windows(self, account):
+        # the (window_start, window_end) date ranges a backfill already finished
+        try:
+            with self.cursor() as cur:
+                cur.execute(
+                    "SELECT window_start, window_end FROM backfill_windows WHERE account = %s",
+                    (account,),
                 )
-                recent_count = cur.fetchone()[0]
+                return set(cur.fetchall())
+        except Exception as e:
+            print(f"(+_+) error reading backfill windows: {e}")
+            return set()
 
+    def save_backfill_window(self, account, window_start, window_end, inserted=0, duplicates=0):
+        try:
+            with self.cursor() as cur:
                 cur.execute(
                     """
-                    SELECT
-                        SUM(CASE WHEN label = 'application' THEN 1 ELSE 0 END) AS applications,
-                        SUM(CASE WHEN label = 'interview' THEN 1 ELSE 0 END)   AS interviews,
-                        SUM(CASE WHEN label = 'offer' THEN 1 ELSE 0 END)       AS offers,
-                        SUM(CASE WHEN label = 'rejection' THEN 1 ELSE 0 END)   AS rejections
-                    FROM job_emails;
-                """
+                    INSERT INTO backfill_windows (account, window_start, window_end, inserted, duplicates)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (account, window_start, window_end)
+                    DO UPDATE SET inserted = EXCLUDED.inserted, duplicates = EXCLUDED.duplicates, completed_at = NOW();
+                """,
+                    (account, window_start, window_end, inserted, duplicates),
                 )
-                pipeline_row = cur.fetchone()
-                pipeline = {
-                    "applications": pipeline_row[0] or 0,
-                    "interviews": pipeline_row[1] or 0,
-                    "offers": pipeline_row[2] or 0,
-                    "rejections": pipeline_row[3] or 0,
-                }
-
-                return {
-                    "total": total_count,
-                    "by_label": label_counts,
-                    "recent": recent_count,
-                    "pipeline": pipeline,
-                }
+                return True
         except Exception as e:
-            print(f"(+_+) error getting statistics: {e}")
-            return None
+            print(f"(+_+) error saving backfill window: {e}")
+            return False
 
     def close(self):
-        if self.conn:
-            self.conn.close()
+        if self.pool:
+            self.pool.closeall()
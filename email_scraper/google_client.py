@@ -0,0 +1,74 @@
+# everything that needs the google client stack lives here. script.py only imports
+# this module on the first authenticate(), so browsing the database never pays for it
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+
+import httplib2
+from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+
+from email_scraper.metrics import METRICS
+
+REFRESH_MARGIN = timedelta(minutes=5)  # refresh this long before the access token runs out
+
+_discovery_docs = {}
+_discovery_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+
+
+class CountingHttp(httplib2.Http):
+    # counts response bytes as they come off the wire, for the metrics report
+    def request(self, *args, **kwargs):
+        response, content = super().request(*args, **kwargs)
+        METRICS.incr("gmail.bytes_received", len(content or b""))
+        return response, content
+
+
+def discovery_document(service_name="gmail", version="v1"):
+    # the discovery json that ships with google-api-python-client, parsed once per process
+    key = (service_name, version)
+    with _discovery_lock:
+        doc = _discovery_docs.get(key)
+        if doc is None:
+            doc = _discovery_docs[key] = json.loads(get_static_doc(service_name, version))
+    return doc
+
+
+def build_service(creds, api_endpoint=None):
+    # no discovery request and no json parsing after the first call, only the resource objects
+    client_options = {"api_endpoint": api_endpoint} if api_endpoint else None
+    http = AuthorizedHttp(creds, http=CountingHttp())
+    return build_from_document(discovery_document(), http=http, client_options=client_options)
+
+
+def needs_refresh(creds):
+    if not creds.refresh_token:
+        return False
+    if creds.expiry is None:
+        return not creds.valid
+    # google-auth keeps expiry as a naive utc datetime
+    return creds.expiry - REFRESH_MARGIN <= datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def refresh_credentials(creds):
+    # returns True if this call refreshed them. the lock keeps worker threads that share
+    # one Credentials object from all refreshing it at the same time
+    if not needs_refresh(creds):
+        return False
+    with _refresh_lock:
+        if not needs_refresh(creds):
+            return False
+        METRICS.incr("gmail.token_refreshes")
+        with METRICS.span("gmail.auth", step="refresh"):
+            creds.refresh(Request())
+        return True
+
+
+def run_consent_flow(client_config, scopes):
+    flow = InstalledAppFlow.from_client_config(client_config, scopes)
+    with METRICS.span("gmail.auth", step="consent"):
+        return flow.run_local_server(port=8080)
@@ -1,7 +1,16 @@
+import queue
 import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import ttk, messagebox
 from email_scraper.database import DatabaseManager
 from email_scraper.script import GmailManager, JOB_KEYWORDS, JOB_RELATED_KEYWORDS
+from email_scraper.worker import SyncWorker
+
+PAGE_SIZE = 200
+PREFETCH_THRESHOLD = 0.9  # fraction of the list scrolled before the next page loads
+SYNC_POLL_MS = 100
+QUERY_POLL_MS = 20
+SEARCH_DEBOUNCE_MS = 250  # typing pause before a search query goes out
 
 
 class JobSearchGUI:
@@ -10,6 +19,21 @@ class JobSearchGUI:
         self.root.title("job application tracker")
         self.db = DatabaseManager()
         self.gmail = GmailManager()
+        self.page_filters = {}
+        self.page_after = None
+        # True while the list shows ranked full-text hits, scrolling then pages search_emails
+        self.page_ranked = False
+        self.pages_exhausted = True
+        self.page_pending = False
+        self.sync_worker = None
+        # rows currently in the tree keyed by item id (str(email_id)), refreshes are diffed against it
+        self.tree_rows = {}
+        # list queries run on one background thread, results older than query_generation are dropped
+        self.query_pool = ThreadPoolExecutor(max_workers=1)
+        self.query_results = queue.Queue()
+        self.query_generation = 0
+        self.query_polling = False
+        self.search_after_id = None
         self.setup_gui()
         self.load_emails()
 
@@ -20,12 +44,19 @@ class JobSearchGUI:
         button_frame = ttk.Frame(main_frame)
         button_frame.grid(row=0, column=0, columnspan=2, pady=10)
 
-        ttk.Button(button_frame, text="get new emails", command=self.fetch_new_emails).pack(
-            side=tk.LEFT, padx=5
+        self.sync_button = ttk.Button(
+            button_frame, text="get new emails", command=self.fetch_new_emails
+        )
+        self.sync_button.pack(side=tk.LEFT, padx=5)
+        self.cancel_button = ttk.Button(
+            button_frame, text="cancel sync", command=self.cancel_sync, state="disabled"
         )
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="refresh", command=self.load_emails).pack(
             side=tk.LEFT, padx=5
         )
+        self.status_var = tk.StringVar()
+        ttk.Label(button_frame, textvariable=self.status_var).pack(side=tk.LEFT, padx=10)
 
         # filter + search row
         filter_frame = ttk.Frame(main_frame)
@@ -43,11 +74,14 @@ class JobSearchGUI:
         self.filter_label_combo["values"] = ("all",) + tuple(JOB_KEYWORDS.keys())
         self.filter_label_combo.current(0)
         self.filter_label_combo.pack(side=tk.LEFT, padx=(0, 15))
+        self.filter_label_combo.bind("<<ComboboxSelected>>", lambda event: self.load_emails())
 
         ttk.Label(filter_frame, text="search:").pack(side=tk.LEFT, padx=(0, 5))
         self.search_var = tk.StringVar()
         search_entry = ttk.Entry(filter_frame, textvariable=self.search_var, width=30)
         search_entry.pack(side=tk.LEFT, padx=(0, 5))
+        search_entry.bind("<Return>", lambda event: self.load_emails())
+        self.search_var.trace_add("write", self.on_search_changed)
 
         ttk.Button(filter_frame, text="apply", command=self.load_emails).pack(
             side=tk.LEFT, padx=(5, 0)
@@ -66,9 +100,10 @@ class JobSearchGUI:
         self.tree.heading("Sender", text="sender")
         self.tree.heading("Label", text="label")
 
-        scrollbar = ttk.Scrollbar(main_frame, orient=tk.VERTICAL, command=self.tree.yview)
-        scrollbar.grid(row=2, column=2, sticky=(tk.N, tk.S))
-        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.scrollbar = ttk.Scrollbar(main_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.scrollbar.grid(row=2, column=2, sticky=(tk.N, tk.S))
+        # rows are loaded a page at a time as the view nears the bottom
+        self.tree.configure(yscrollcommand=self.on_tree_scroll)
 
         # actions
         action_frame = ttk.LabelFrame(main_frame, text="actions", padding="5")
@@ -132,20 +167,28 @@ class JobSearchGUI:
         if not confirm:
             return
 
-        deleted_count = 0
-        for item in selected_items:
-            email_id = self.tree.item(item)["tags"][0]
-            if self.db.delete_email(email_id):
-                deleted_count += 1
+        items = self.selected_items_by_id(selected_items)
+        deleted = self.db.delete_emails(list(items))
+        if deleted is None:
+            messagebox.showerror("error", "could not delete the selected emails")
+            return
 
-        self.load_emails()
+        # only the deleted rows leave the tree, the rest of the view stays as it was
+        if deleted:
+            self.tree.delete(*(items[email_id] for email_id in deleted))
+        for email_id in deleted:
+            self.tree_rows.pop(items[email_id], None)
+        self.update_statistics()
+        deleted_count = len(deleted)
         messagebox.showinfo(
             "deletion complete",
             f"removed {deleted_count} email{'s' if deleted_count > 1 else ''} from database",
         )
 
     def update_statistics(self):
-        stats = self.db.get_statistics()
+        self.render_statistics(self.db.get_statistics())
+
+    def render_statistics(self, stats):
         if not stats:
             return
 
@@ -177,9 +220,16 @@ class JobSearchGUI:
         self.stats_text.insert("1.0", stats_str)
         self.stats_text.config(state="disabled")
 
+    def on_search_changed(self, *args):
+        # search as you type, the query only goes out once typing pauses
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+        self.search_after_id = self.root.after(SEARCH_DEBOUNCE_MS, self.load_emails)
+
     def load_emails(self):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+            self.search_after_id = None
 
         # read filters if they exist
         label_filter = getattr(self, "filter_label_var", None)
@@ -188,27 +238,166 @@ class JobSearchGUI:
         label_value = label_filter.get() if label_filter else None
         search_value = search_text.get().strip() if search_text else None
 
-        # fetch from DB
-        if label_value or search_value:
-            emails = self.db.get_emails(label=label_value, search=search_value)
-        else:
-            emails = self.db.get_all_emails()
+        # filters are pinned for the whole scroll so pages stay consistent
+        filters = {"label": label_value, "search": search_value}
+        # reload as many rows as have been scrolled into view so the list doesn't jump
+        limit = max(PAGE_SIZE, len(self.tree_rows))
 
-        for email in emails:
-            email_id, subject, sender, received_date, label = email
-            self.tree.insert(
-                "",
-                "end",
-                values=(
-                    received_date.strftime("%Y-%m-%d %H:%M"),
-                    subject,
-                    sender,
-                    label,
-                ),
-                tags=(str(email_id),),
-            )
+        self.query_generation += 1
+        self.query_pool.submit(self.run_query, self.query_generation, filters, limit)
+        self.start_query_polling()
 
-        self.update_statistics()
+    def start_query_polling(self):
+        if not self.query_polling:
+            self.query_polling = True
+            self.root.after(QUERY_POLL_MS, self.poll_query)
+
+    def run_query(self, generation, filters, limit):
+        # runs on the query thread, never touches tk
+        if generation != self.query_generation:
+            return  # superseded while it was queued
+
+        rows, exhausted, after, ranked, stats = [], True, None, False, None
+        try:
+            # ranked full-text hits first, substring paging catches partial words/addresses
+            search = filters["search"]
+            hits = self.db.search_emails(search, label=filters["label"], limit=limit) if search else []
+            if hits:
+                rows = [hit[:5] for hit in hits]
+                exhausted = len(hits) < limit
+                after = self.hit_key(hits[-1])
+                ranked = True
+            else:
+                rows = self.db.get_emails_page(limit=limit, **filters)
+                exhausted = len(rows) < limit
+                after = (rows[-1][3], rows[-1][0]) if rows else None
+            stats = self.db.get_statistics()
+        except Exception as e:
+            print(f"(+_+) error loading emails: {e}")
+        finally:
+            self.query_results.put((generation, "reload", (filters, rows, exhausted, after, ranked, stats)))
+
+    def run_page_query(self, generation, filters, after, ranked):
+        # runs on the query thread, never touches tk. the page after `after`, from the
+        # ranked hits when the list holds them, else from plain date paging
+        if generation != self.query_generation:
+            return  # a reload replaced the list this page was for
+
+        rows, next_after = [], None
+        try:
+            if ranked:
+                hits = self.db.search_emails(filters["search"], label=filters["label"], after=after, limit=PAGE_SIZE)
+                rows = [hit[:5] for hit in hits]
+                next_after = self.hit_key(hits[-1]) if hits else None
+            else:
+                rows = self.db.get_emails_page(after=after, limit=PAGE_SIZE, **filters)
+                next_after = (rows[-1][3], rows[-1][0]) if rows else None
+        except Exception as e:
+            print(f"(+_+) error loading the next page: {e}")
+        finally:
+            self.query_results.put((generation, "page", (rows, next_after)))
+
+    def poll_query(self):
+        results = []
+        while True:
+            try:
+                result = self.query_results.get_nowait()
+            except queue.Empty:
+                break
+            # anything from an older generation is stale and dropped
+            if result[0] == self.query_generation:
+                results.append(result)
+
+        if not results:
+            self.root.after(QUERY_POLL_MS, self.poll_query)
+            return
+
+        self.query_polling = False
+        for _, kind, payload in results:
+            if kind == "page":
+                self.show_page(*payload)
+            else:
+                self.show_rows(*payload)
+
+    def show_rows(self, filters, rows, exhausted, after, ranked, stats):
+        self.page_filters = filters
+        self.pages_exhausted = exhausted
+        self.page_after = after
+        self.page_ranked = ranked
+        self.page_pending = False
+        self.sync_tree(rows)
+        self.render_statistics(stats)
+
+    def sync_tree(self, rows):
+        # diffs the tree against `rows` (in display order): only new rows are inserted,
+        # changed ones updated and missing ones removed, so selection and scroll survive
+        wanted = [str(row[0]) for row in rows]
+        wanted_set = set(wanted)
+
+        stale = [item for item in self.tree_rows if item not in wanted_set]
+        if stale:
+            self.tree.delete(*stale)
+            for item in stale:
+                del self.tree_rows[item]
+
+        kept = [item for item in wanted if item in self.tree_rows]
+        if list(self.tree.get_children()) != kept:
+            for index, item in enumerate(kept):
+                self.tree.move(item, "", index)
+
+        for index, row in enumerate(rows):
+            item = wanted[index]
+            old = self.tree_rows.get(item)
+            if old is None:
+                self.tree.insert("", index, iid=item, values=self.format_row(row), tags=(item,))
+            elif old != tuple(row):
+                self.tree.item(item, values=self.format_row(row))
+            self.tree_rows[item] = tuple(row)
+
+    def load_next_page(self):
+        # page_pending stays set until show_page, so scrolling doesn't queue the same page twice
+        if self.pages_exhausted:
+            self.page_pending = False
+            return
+
+        self.query_pool.submit(
+            self.run_page_query, self.query_generation, self.page_filters, self.page_after, self.page_ranked
+        )
+        self.start_query_polling()
+
+    def show_page(self, emails, after):
+        self.page_pending = False
+        if len(emails) < PAGE_SIZE:
+            self.pages_exhausted = True
+        if not emails:
+            return
+
+        self.insert_tree_rows(emails)
+        self.page_after = after
+
+    @staticmethod
+    def hit_key(hit):
+        # (rank, recieved_date, id), the keyset search_emails pages on
+        return (hit[5], hit[3], hit[0])
+
+    @staticmethod
+    def format_row(email):
+        email_id, subject, sender, received_date, label = email
+        return (received_date.strftime("%Y-%m-%d %H:%M"), subject, sender, label)
+
+    def insert_tree_rows(self, emails, index="end"):
+        for email in emails:
+            item = str(email[0])
+            if item in self.tree_rows:
+                continue
+            self.tree.insert("", index, iid=item, values=self.format_row(email), tags=(item,))
+            self.tree_rows[item] = tuple(email)
+
+    def on_tree_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if float(last) >= PREFETCH_THRESHOLD and not self.pages_exhausted and not self.page_pending:
+            self.page_pending = True
+            self.root.after_idle(self.load_next_page)
 
     def update_label(self):
         selected_items = self.tree.selection()
@@ -221,37 +410,90 @@ class JobSearchGUI:
             messagebox.showwarning("label required", "please select a label")
             return
 
-        for item in selected_items:
-            email_id = self.tree.item(item)["tags"][0]
-            if self.db.update_email_label(email_id, new_label):
-                self.tree.set(item, "Label", new_label)
+        items = self.selected_items_by_id(selected_items)
+        updated = self.db.update_email_labels(list(items), new_label)
+        if updated is None:
+            messagebox.showerror("error", "could not update the selected emails")
+            return
+
+        for email_id in updated:
+            item = items[email_id]
+            self.tree.set(item, "Label", new_label)
+            row = self.tree_rows.get(item)
+            if row is not None:
+                self.tree_rows[item] = row[:4] + (new_label,)
 
         self.update_statistics()
 
+    def selected_items_by_id(self, selected_items):
+        # {email_id: tree item}, the id is kept in each row's first tag
+        return {int(self.tree.item(item)["tags"][0]): item for item in selected_items}
+
     def fetch_new_emails(self):
-        if not self.gmail.service and not self.gmail.authenticate():
-            messagebox.showerror("authentication error", "failed to authenticate with Gmail")
+        if self.sync_worker is not None:
             return
 
-        try:
-            new_emails = self.gmail.fetch_emails()
-            new_emails_count = 0
-
-            for email in new_emails:
-                message_id = email.get("message_id", None)
-                if self.db.insert_email(
-                    email["subject"],
-                    email["sender"],
-                    email["received_date"],
-                    email["label"],
-                    message_id,
-                ):
-                    new_emails_count += 1
-
-            messagebox.showinfo("complete", f"added {new_emails_count} new emails")
-            self.load_emails()
-        except Exception as e:
-            messagebox.showerror("error", f"error grabbing emails: {e}")
+        # the sync runs on a worker thread, results come back through poll_sync
+        self.sync_worker = SyncWorker(self.gmail, self.db)
+        self.sync_button.config(state="disabled")
+        self.cancel_button.config(state="normal")
+        self.sync_worker.start()
+        self.root.after(SYNC_POLL_MS, self.poll_sync)
+
+    def cancel_sync(self):
+        if self.sync_worker is not None:
+            self.sync_worker.cancel()
+            self.status_var.set("cancelling...")
+
+    def poll_sync(self):
+        worker = self.sync_worker
+        if worker is None:
+            return
+
+        while True:
+            try:
+                kind, payload = worker.events.get_nowait()
+            except queue.Empty:
+                break
+
+            if kind == "status":
+                self.status_var.set(payload)
+            elif kind == "rows":
+                self.add_synced_rows(payload)
+            else:
+                self.finish_sync(kind, payload)
+                return
+
+        self.root.after(SYNC_POLL_MS, self.poll_sync)
+
+    def add_synced_rows(self, rows):
+        # new mail goes on top, only rows that match the current filters are shown
+        label = self.page_filters.get("label")
+        search = (self.page_filters.get("search") or "").lower()
+
+        matching = [
+            row
+            for row in sorted(rows, key=lambda row: row[3])
+            if not (label and label.lower() != "all" and row[4] != label)
+            and not (search and search not in (row[1] or "").lower() and search not in (row[2] or "").lower())
+        ]
+        self.insert_tree_rows(matching, index=0)
+
+    def finish_sync(self, kind, payload):
+        self.sync_worker = None
+        self.sync_button.config(state="normal")
+        self.cancel_button.config(state="disabled")
+        self.status_var.set("")
+        self.update_statistics()
+
+        if kind == "done":
+            messagebox.showinfo("complete", f"added {payload} new emails")
+        elif kind == "cancelled":
+            messagebox.showinfo("cancelled", f"sync cancelled, added {payload} new emails")
+        elif kind == "auth_error":
+            messagebox.showerror("authentication error", payload)
+        else:
+            messagebox.showerror("error", f"error grabbing emails: {payload}")
 
 
 def main():
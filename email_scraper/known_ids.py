@@ -0,0 +1,75 @@
+import hashlib
+import math
+import threading
+
+KNOWN_IDS_SET_LIMIT = 250_000  # past this many stored ids the prefilter switches to a bloom filter
+BLOOM_ERROR_RATE = 0.001
+BLOOM_HEADROOM = 2  # bloom capacity as a multiple of the rows stored when it was built
+
+
+class BloomFilter:
+    # fixed size bloom filter over strings, ~1.8 bytes per item at a 0.1% false positive rate
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        capacity = max(1, capacity)
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # double hashing off one blake2b digest instead of `hashes` separate hashes
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        step = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * step) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def __len__(self):
+        return self.count
+
+
+class KnownMessageIds:
+    # message ids already in job_emails, loaded once per sync so listed ids can skip the
+    # messages().get. small archives get an exact set, big ones a bloom filter whose
+    # hits are confirmed against the database so a false positive never drops an email
+    def __init__(self, db, expected=0):
+        self.db = db
+        self.lock = threading.Lock()
+        self.exact = expected <= KNOWN_IDS_SET_LIMIT
+        self.ids = set() if self.exact else BloomFilter(expected * BLOOM_HEADROOM)
+
+    @classmethod
+    def load(cls, db):
+        stats = db.get_statistics() or {}
+        known = cls(db, expected=stats.get("total", 0))
+        known.add_many(db.iter_message_ids())
+        return known
+
+    def add_many(self, message_ids):
+        # parallel backfill windows commit from several threads
+        with self.lock:
+            for message_id in message_ids:
+                if message_id:
+                    self.ids.add(message_id)
+
+    def unknown(self, message_ids):
+        # the ids from message_ids that aren't stored yet, order kept
+        maybe_known = [m for m in message_ids if m in self.ids]
+        if not maybe_known:
+            return list(message_ids)
+
+        if self.exact:
+            known = set(maybe_known)
+        else:
+            known = self.db.get_stored_message_ids(maybe_known)
+        return [m for m in message_ids if m not in known]
+
+    def __len__(self):
+        return len(self.ids)
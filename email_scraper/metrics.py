@@ -0,0 +1,128 @@
+import cProfile
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+PROMETHEUS_PREFIX = "email_scraper"
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    # process-wide counters and timing spans for the sync pipeline, thread safe.
+    # counters: incr("gmail.api_calls", kind="messages.get")
+    # spans:    with METRICS.span("db.operation"): ...
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.spans = {}  # key -> [count, total_seconds, max_seconds]
+            self.started = time.time()
+
+    def incr(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            span = self.spans.get(key)
+            if span is None:
+                self.spans[key] = [1, seconds, seconds]
+            else:
+                span[0] += 1
+                span[1] += seconds
+                span[2] = max(span[2], seconds)
+
+    @contextmanager
+    def span(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def report(self):
+        # json friendly snapshot
+        def render(name, labels):
+            if not labels:
+                return name
+            return name + "{" + ",".join(f"{k}={v}" for k, v in labels) + "}"
+
+        with self.lock:
+            return {
+                "started_at": self.started,
+                "duration": round(time.time() - self.started, 3),
+                "counters": {render(*key): value for key, value in sorted(self.counters.items())},
+                "spans": {
+                    render(*key): {
+                        "count": count,
+                        "total_seconds": round(total, 6),
+                        "max_seconds": round(longest, 6),
+                    }
+                    for key, (count, total, longest) in sorted(self.spans.items())
+                },
+            }
+
+    def prometheus(self):
+        # text exposition format, counters as _total and spans as summaries
+        def metric(name):
+            return f"{PROMETHEUS_PREFIX}_" + name.replace(".", "_").replace("-", "_")
+
+        def render_labels(labels):
+            if not labels:
+                return ""
+            escaped = (f'{k}="{_escape_label(v)}"' for k, v in labels)
+            return "{" + ",".join(escaped) + "}"
+
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            spans = sorted(self.spans.items())
+
+        seen = set()
+        for (name, labels), value in counters:
+            full = metric(name) + "_total"
+            if full not in seen:
+                seen.add(full)
+                lines.append(f"# TYPE {full} counter")
+            lines.append(f"{full}{render_labels(labels)} {value}")
+
+        for (name, labels), (count, total, _) in spans:
+            full = metric(name) + "_seconds"
+            if full not in seen:
+                seen.add(full)
+                lines.append(f"# TYPE {full} summary")
+            lines.append(f"{full}_count{render_labels(labels)} {count}")
+            lines.append(f"{full}_sum{render_labels(labels)} {total:.6f}")
+
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+@contextmanager
+def profiled(path=None, limit=30):
+    # cProfile around a block, dumps raw stats to `path` or prints the top `limit` entries
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if path:
+            profiler.dump_stats(path)
+        else:
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(limit)
@@ -0,0 +1,50 @@
+import random
+import threading
+import time
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded")
+
+
+class TokenBucket:
+    # thread-safe token bucket, refills at `rate` tokens per second up to `capacity`
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens=1):
+        # requests bigger than the bucket (a full batch) wait for a full bucket and
+        # leave it in debt, so the average rate still holds
+        needed = min(tokens, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= needed:
+                    self.tokens -= tokens
+                    return
+                wait = (needed - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def backoff_delay(attempt, base=0.5, cap=32.0):
+    # exponential backoff with full jitter
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def is_retryable(error):
+    # takes a googleapiclient HttpError
+    status = getattr(error.resp, "status", None)
+    if status in RETRYABLE_STATUSES:
+        return True
+    if status == 403:
+        content = error.content.decode("utf-8", "replace") if isinstance(error.content, bytes) else str(error.content)
+        return any(reason in content for reason in RATE_LIMIT_REASONS)
+    return False
@@ -0,0 +1,321 @@
+# versioned schema for the tracker, applied in order at startup.
+# never edit a shipped migration, append a new one instead
+MIGRATIONS = [
+    (
+        1,
+        "create job_emails",
+        """
+        CREATE TABLE IF NOT EXISTS job_emails (
+            id SERIAL PRIMARY KEY,
+            subject TEXT,
+            sender TEXT,
+            recieved_date TIMESTAMP,
+            label TEXT,
+            message_id TEXT
+        );
+        """,
+    ),
+    (
+        2,
+        "create sync_state",
+        """
+        CREATE TABLE IF NOT EXISTS sync_state (
+            account TEXT PRIMARY KEY,
+            history_id BIGINT NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+        """,
+    ),
+    (
+        3,
+        "unique message_id and subject/sender/date dedupe_key",
+        """
+        ALTER TABLE job_emails
+        ADD COLUMN IF NOT EXISTS dedupe_key TEXT
+        GENERATED ALWAYS AS (
+            md5(subject || chr(31) || sender || chr(31) || extract(epoch FROM recieved_date)::text)
+        ) STORED;
+
+        -- older installs could end up with duplicates, keep the first copy
+        DELETE FROM job_emails a USING job_emails b
+        WHERE a.message_id = b.message_id AND a.id > b.id;
+
+        DELETE FROM job_emails a USING job_emails b
+        WHERE a.dedupe_key = b.dedupe_key AND a.id > b.id;
+
+        CREATE UNIQUE INDEX IF NOT EXISTS job_emails_message_id_key
+        ON job_emails (message_id);
+
+        CREATE UNIQUE INDEX IF NOT EXISTS job_emails_dedupe_key_key
+        ON job_emails (dedupe_key);
+        """,
+    ),
+    (
+        4,
+        "indexes for label filter, date sort and ILIKE search",
+        """
+        CREATE INDEX IF NOT EXISTS job_emails_label_date_idx
+        ON job_emails (label, recieved_date DESC);
+
+        CREATE INDEX IF NOT EXISTS job_emails_date_idx
+        ON job_emails (recieved_date DESC);
+
+        -- pg_trgm ships with contrib, servers without it (or roles that may not create
+        -- extensions) just keep seq-scanning ILIKE
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+                BEGIN
+                    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+                    EXECUTE 'CREATE INDEX IF NOT EXISTS job_emails_subject_trgm_idx
+                             ON job_emails USING gin (subject gin_trgm_ops)';
+                    EXECUTE 'CREATE INDEX IF NOT EXISTS job_emails_sender_trgm_idx
+                             ON job_emails USING gin (sender gin_trgm_ops)';
+                EXCEPTION WHEN insufficient_privilege THEN
+                    RAISE NOTICE 'not allowed to create pg_trgm, skipping trigram search indexes';
+                END;
+            ELSE
+                RAISE NOTICE 'pg_trgm is not available, skipping trigram search indexes';
+            END IF;
+        END
+        $$;
+
+        ANALYZE job_emails;
+        """,
+    ),
+    (
+        5,
+        "keyset pagination indexes on (recieved_date, id)",
+        """
+        DROP INDEX IF EXISTS job_emails_label_date_idx;
+        DROP INDEX IF EXISTS job_emails_date_idx;
+
+        CREATE INDEX IF NOT EXISTS job_emails_label_date_id_idx
+        ON job_emails (label, recieved_date, id);
+
+        CREATE INDEX IF NOT EXISTS job_emails_date_id_idx
+        ON job_emails (recieved_date, id);
+        """,
+    ),
+    (
+        6,
+        "per-label counts kept current by statement triggers",
+        """
+        -- null labels are stored under '' because they can't be a primary key
+        CREATE TABLE IF NOT EXISTS email_label_counts (
+            label TEXT PRIMARY KEY,
+            count BIGINT NOT NULL DEFAULT 0
+        );
+
+        CREATE OR REPLACE FUNCTION job_emails_count_labels() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                UPDATE email_label_counts c
+                SET count = c.count - d.n
+                FROM (
+                    SELECT COALESCE(label, '') AS label, COUNT(*) AS n
+                    FROM old_rows GROUP BY 1
+                ) d
+                WHERE c.label = d.label;
+            END IF;
+
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO email_label_counts (label, count)
+                SELECT COALESCE(label, ''), COUNT(*) FROM new_rows GROUP BY 1
+                ON CONFLICT (label)
+                DO UPDATE SET count = email_label_counts.count + EXCLUDED.count;
+            END IF;
+
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        -- transition tables only allow one event per trigger
+        DROP TRIGGER IF EXISTS job_emails_count_insert ON job_emails;
+        CREATE TRIGGER job_emails_count_insert
+        AFTER INSERT ON job_emails
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION job_emails_count_labels();
+
+        DROP TRIGGER IF EXISTS job_emails_count_delete ON job_emails;
+        CREATE TRIGGER job_emails_count_delete
+        AFTER DELETE ON job_emails
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION job_emails_count_labels();
+
+        DROP TRIGGER IF EXISTS job_emails_count_update ON job_emails;
+        CREATE TRIGGER job_emails_count_update
+        AFTER UPDATE ON job_emails
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION job_emails_count_labels();
+
+        -- seed from what's already there, under a lock so no write slips in between
+        LOCK TABLE job_emails IN SHARE MODE;
+        TRUNCATE email_label_counts;
+        INSERT INTO email_label_counts (label, count)
+        SELECT COALESCE(label, ''), COUNT(*) FROM job_emails GROUP BY 1;
+        """,
+    ),
+    (
+        7,
+        "snippet column and full-text search vector",
+        """
+        ALTER TABLE job_emails ADD COLUMN IF NOT EXISTS snippet TEXT;
+
+        -- sender uses the simple config so addresses and names aren't stemmed
+        ALTER TABLE job_emails
+        ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(subject, '')), 'A')
+            || setweight(to_tsvector('simple', coalesce(sender, '')), 'B')
+            || setweight(to_tsvector('english', coalesce(snippet, '')), 'C')
+        ) STORED;
+
+        CREATE INDEX IF NOT EXISTS job_emails_search_idx
+        ON job_emails USING gin (search_vector);
+        """,
+    ),
+    (
+        8,
+        "track whether a label came from the classifier or the user",
+        """
+        -- rows from before this point can't be told apart and start out as 'auto'
+        ALTER TABLE job_emails
+        ADD COLUMN IF NOT EXISTS label_source TEXT NOT NULL DEFAULT 'auto';
+        """,
+    ),
+    (
+        9,
+        "reset label counts when job_emails is truncated",
+        """
+        -- TRUNCATE doesn't fire the delete triggers from migration 6
+        CREATE OR REPLACE FUNCTION job_emails_reset_label_counts() RETURNS trigger AS $$
+        BEGIN
+            DELETE FROM email_label_counts;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS job_emails_count_truncate ON job_emails;
+        CREATE TRIGGER job_emails_count_truncate
+        AFTER TRUNCATE ON job_emails
+        FOR EACH STATEMENT EXECUTE FUNCTION job_emails_reset_label_counts();
+
+        -- counts may already have drifted from an earlier truncate
+        LOCK TABLE job_emails IN SHARE MODE;
+        DELETE FROM email_label_counts;
+        INSERT INTO email_label_counts (label, count)
+        SELECT COALESCE(label, ''), COUNT(*) FROM job_emails GROUP BY 1;
+        """,
+    ),
+    (
+        10,
+        "account column for multi-account sync",
+        """
+        ALTER TABLE job_emails ADD COLUMN IF NOT EXISTS account TEXT;
+
+        -- with a single synced account every existing row must have come from it
+        UPDATE job_emails SET account = (SELECT account FROM sync_state)
+        WHERE account IS NULL AND (SELECT COUNT(*) FROM sync_state) = 1;
+
+        CREATE INDEX IF NOT EXISTS job_emails_account_date_id_idx
+        ON job_emails (account, recieved_date, id);
+        """,
+    ),
+    (
+        11,
+        "backfill window checkpoints",
+        """
+        -- one row per fully imported [window_start, window_end) date range
+        CREATE TABLE IF NOT EXISTS backfill_windows (
+            account TEXT NOT NULL,
+            window_start DATE NOT NULL,
+            window_end DATE NOT NULL,
+            inserted INTEGER NOT NULL DEFAULT 0,
+            duplicates INTEGER NOT NULL DEFAULT 0,
+            completed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (account, window_start, window_end)
+        );
+        """,
+    ),
+    (
+        12,
+        "keep labels from before label_source out of reclassify",
+        """
+        -- rows without a snippet predate label tracking, migration 8 called them 'auto'
+        -- but some were set by hand and the rest were classified on text we no longer have
+        UPDATE job_emails SET label_source = 'legacy'
+        WHERE label_source = 'auto' AND snippet IS NULL;
+        """,
+    ),
+    (
+        13,
+        "lock label counts in label order",
+        """
+        -- same as migration 6, but the counter rows are always locked in label order so
+        -- two bulk writes touching the same labels queue up instead of deadlocking
+        CREATE OR REPLACE FUNCTION job_emails_count_labels() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                PERFORM 1 FROM email_label_counts
+                WHERE label IN (SELECT COALESCE(label, '') FROM old_rows)
+                ORDER BY label
+                FOR UPDATE;
+
+                UPDATE email_label_counts c
+                SET count = c.count - d.n
+                FROM (
+                    SELECT COALESCE(label, '') AS label, COUNT(*) AS n
+                    FROM old_rows GROUP BY 1
+                ) d
+                WHERE c.label = d.label;
+            END IF;
+
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO email_label_counts (label, count)
+                SELECT COALESCE(label, ''), COUNT(*) FROM new_rows GROUP BY 1 ORDER BY 1
+                ON CONFLICT (label)
+                DO UPDATE SET count = email_label_counts.count + EXCLUDED.count;
+            END IF;
+
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+    ),
+]
+
+MIGRATION_LOCK_ID = 720_443_001  # arbitrary advisory lock key shared by every process
+
+
+def apply_migrations(db):
+    # takes a DatabaseManager, returns the versions that were applied this run
+    with db.cursor() as cur:
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+        """
+        )
+
+    applied = []
+    for version, description, sql in MIGRATIONS:
+        # one transaction per migration, the lock keeps two app instances from racing
+        with db.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+            cur.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+            if cur.fetchone():
+                continue
+
+            cur.execute(sql)
+            cur.execute(
+                "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                (version, description),
+            )
+            print(f"applied migration {version}: {description} (b^_^)b")
+            applied.append(version)
+
+    return applied
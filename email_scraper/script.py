@@ -1,18 +1,25 @@
 import os
 import pickle
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from email_scraper.body import BODY_FIELDS, extract_body_text, has_body
+from email_scraper.cache import DEFAULT_CACHE_PATH, MessageCache
+from email_scraper.classifier import KeywordClassifier
+from email_scraper.metrics import METRICS
+from email_scraper.ratelimit import TokenBucket, backoff_delay, is_retryable
 
 load_dotenv()
 
 SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
 
+DEFAULT_TOKEN_PATH = "token.pickle"
+DEFAULT_TOKEN_DIR = "accounts"
+
 JOB_KEYWORDS = {
     "application": [
         "application received", "thank you for applying", "your application",
@@ -102,96 +109,574 @@ JOB_RELATED_KEYWORDS = [
     "part-time", "contract", "temporary", "permanent", "staffing", "talent acquisition"
 ]
 
+CLASSIFIER = KeywordClassifier(JOB_KEYWORDS, JOB_RELATED_KEYWORDS)
+
+GMAIL_BATCH_LIMIT = 100  # max sub-requests gmail accepts in one batch http request
+GMAIL_MAX_PAGE_SIZE = 500  # max maxResults for messages().list
+DEFAULT_PAGE_SIZE = 100
+
+# "metadata" only pulls the headers we classify on, "full" is kept for comparison/debugging
+FETCH_FORMATS = ("metadata", "full")
+METADATA_HEADERS = ["Subject", "From"]
+METADATA_FIELDS = "id,threadId,internalDate,snippet,payload/headers"
+
+# gmail's per-user limit and what each call we make costs against it
+GMAIL_QUOTA_UNITS_PER_SECOND = 250
+QUOTA_COSTS = {
+    "messages.get": 5,
+    "messages.list": 5,
+    "history.list": 2,
+    "getProfile": 1,
+}
+
+
+def token_dir():
+    return os.getenv("GMAIL_TOKEN_DIR", DEFAULT_TOKEN_DIR)
+
+
+def token_path(account_name=None):
+    # the unnamed account keeps using ./token.pickle, named ones live in GMAIL_TOKEN_DIR
+    if not account_name:
+        return DEFAULT_TOKEN_PATH
+    # basename splits on every separator the platform takes, "/" as well as "\" and drives on windows
+    if os.path.basename(account_name) != account_name or account_name.startswith("."):
+        raise ValueError(f"invalid account name {account_name!r}")
+    return os.path.join(token_dir(), f"{account_name}.pickle")
+
+
+def list_accounts():
+    # names of every account that has stored credentials
+    try:
+        files = os.listdir(token_dir())
+    except FileNotFoundError:
+        return []
+    return sorted(f[:-len(".pickle")] for f in files if f.endswith(".pickle"))
+
+
 class GmailManager:
-    def __init__(self):
+    def __init__(
+        self,
+        batch_size=GMAIL_BATCH_LIMIT,
+        fetch_format=None,
+        workers=1,
+        quota_per_second=GMAIL_QUOTA_UNITS_PER_SECOND,
+        max_retries=5,
+        api_endpoint=None,
+        cache=None,
+        service_factory=None,
+        account_name=None,
+        body_classify=None,
+    ):
+        fetch_format = fetch_format or os.getenv("GMAIL_FETCH_FORMAT", "metadata")
+        if fetch_format not in FETCH_FORMATS:
+            raise ValueError(f"fetch_format must be one of {FETCH_FORMATS}, got {fetch_format!r}")
+        if body_classify is None:
+            body_classify = os.getenv("GMAIL_BODY_CLASSIFY", "1") != "0"
+
         self.service = None
+        self.fetch_format = fetch_format
+        # job related mail that only lands in "other" from its metadata gets its body read
+        self.body_classify = body_classify
+        # account_name picks the stored credentials, account is the gmail address they belong to
+        self.account_name = account_name
+        self.token_path = token_path(account_name)
+        self.account = None
+        self.history_id = None
+        self.batch_size = max(1, min(batch_size, GMAIL_BATCH_LIMIT))
+        self.workers = max(1, workers)
+        self.max_retries = max_retries
+        # shared by every worker thread so together they stay under the per-user quota
+        self.limiter = TokenBucket(quota_per_second)
+        # lets the client point at a local fake gmail server
+        self.api_endpoint = api_endpoint or os.getenv("GMAIL_API_ENDPOINT")
+        # callable returning a service object, used instead of build() (e.g. an in-process fake)
+        self.service_factory = service_factory
+        self.creds = None
+        self._local = threading.local()
+        self._service_thread = None
+        self._pool = None
+        self.sync_mode = None
+        # KnownMessageIds set by run_sync, listed ids already in the database skip the fetch
+        self.known_ids = None
+        # threading.Event set by run_sync/run_backfill, checked between pages and chunks
+        # so a cancel doesn't have to wait for the next job email to come out
+        self.cancel_event = None
+        self._counts_lock = threading.Lock()
+        self.reset_sync_counts()
+
+        # GMAIL_CACHE_PATH="" turns the local metadata cache off
+        if cache is None:
+            cache_path = os.getenv("GMAIL_CACHE_PATH", DEFAULT_CACHE_PATH)
+            cache = MessageCache(cache_path) if cache_path else None
+        # cache=False also turns it off
+        self.cache = None if cache is False else cache
+
+    def reset_sync_counts(self):
+        # per-run pipeline counters, read by the cli/worker run summaries
+        self.sync_counts = {
+            "listed": 0, "known": 0, "cached": 0, "fetched": 0, "classified": 0, "bodies": 0, "refined": 0
+        }
+
+    def _cancelled(self):
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    def _count(self, name, value=1):
+        # backfill windows run the pipeline from several threads at once
+        with self._counts_lock:
+            self.sync_counts[name] += value
 
     def authenticate(self):
+        if self.service is not None and self.creds is not None:
+            # already built for this manager, just make sure the token isn't about to lapse
+            self._refresh_credentials()
+            return True
+
         try:
+            # the google client stack is only imported once something actually needs gmail
+            from email_scraper import google_client
+
             creds = None
-            if os.path.exists("token.pickle"):
-                with open("token.pickle", "rb") as token:
+            if os.path.exists(self.token_path):
+                with open(self.token_path, "rb") as token:
                     creds = pickle.load(token)
 
-            if not creds or not creds.valid:
-                if creds and creds.expired and creds.refresh_token:
-                    creds.refresh(Request())
-                else:
-                    client_secret_json = os.getenv("CLIENT_SECRET_JSON")
-                    if not client_secret_json:
-                        raise ValueError("CLIENT_SECRET_JSON environment variable not found")
-                    
-                    client_config = json.loads(client_secret_json)
-                    flow = InstalledAppFlow.from_client_config(client_config, SCOPES)
-                    creds = flow.run_local_server(port=8080)
-
-                with open("token.pickle", "wb") as token:
-                    pickle.dump(creds, token)
-
-            self.service = build("gmail", "v1", credentials=creds)
+            # refreshed ahead of expiry, not just once it has already lapsed
+            if creds and google_client.refresh_credentials(creds):
+                self._save_credentials(creds)
+            elif not creds or not creds.valid:
+                client_secret_json = os.getenv("CLIENT_SECRET_JSON")
+                if not client_secret_json:
+                    raise ValueError("CLIENT_SECRET_JSON environment variable not found")
+
+                client_config = json.loads(client_secret_json)
+                creds = google_client.run_consent_flow(client_config, SCOPES)
+                self._save_credentials(creds)
+
+            self.creds = creds
+            self.service = self._build_service()
+            self._service_thread = threading.get_ident()
             return True
 
         except Exception as e:
             print(f"(+_+) authentication error: {e}")
             return False
 
-    def fetch_emails(self, days=30):
+    def _save_credentials(self, creds):
+        token_folder = os.path.dirname(self.token_path)
+        if token_folder:
+            os.makedirs(token_folder, exist_ok=True)
+        with open(self.token_path, "wb") as token:
+            pickle.dump(creds, token)
+
+    def _refresh_credentials(self):
+        # called before every request so a long sync never runs into an expired token
+        if self.creds is None:
+            return
+        from email_scraper.google_client import refresh_credentials
+
+        if refresh_credentials(self.creds):
+            self._save_credentials(self.creds)
+
+    def _build_service(self):
+        if self.service_factory is not None:
+            return self.service_factory()
+        from email_scraper.google_client import build_service
+
+        return build_service(self.creds, self.api_endpoint)
+
+    def _thread_service(self):
+        # httplib2 isn't thread safe, so each worker thread gets its own service object
+        if threading.get_ident() == self._service_thread:
+            return self.service
+        service = getattr(self._local, "service", None)
+        if service is None:
+            service = self._local.service = self._build_service()
+        return service
+
+    def _execute(self, request, kind, count=1):
+        # rate limited execute with exponential backoff + jitter on 429/5xx.
+        # kind is a QUOTA_COSTS key, count the number of calls inside a batch
+        cost = QUOTA_COSTS[kind] * count
+        METRICS.incr("gmail.api_calls", count, kind=kind)
+        attempt = 0
+        while True:
+            self._refresh_credentials()
+            with METRICS.span("gmail.quota_wait"):
+                self.limiter.acquire(cost)
+            METRICS.incr("gmail.quota_units", cost)
+            METRICS.incr("gmail.http_requests", kind=kind)
+            try:
+                with METRICS.span("gmail.request", kind=kind):
+                    return request.execute()
+            except HttpError as error:
+                METRICS.incr("gmail.http_errors", kind=kind, status=error.resp.status)
+                if attempt >= self.max_retries or not is_retryable(error):
+                    raise
+                METRICS.incr("gmail.retries", kind=kind)
+                delay = backoff_delay(attempt)
+                print(f"ミ(ノ_ _)ノ gmail returned {error.resp.status}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                attempt += 1
+
+    @property
+    def chunk_size(self):
+        # ids handed to _fetch_message_details at once, one batch per worker
+        return self.batch_size * self.workers
+
+    def _message_request(self, message_id, service=None):
+        messages = (service or self.service).users().messages()
+        if self.fetch_format == "metadata":
+            # no bodies or attachments, just the fields _process_message reads
+            return messages.get(
+                userId="me",
+                id=message_id,
+                format="metadata",
+                metadataHeaders=METADATA_HEADERS,
+                fields=METADATA_FIELDS
+            )
+        return messages.get(userId="me", id=message_id, format="full")
+
+    def _fetch_message_details(self, message_ids):
+        # serves what it can from the local cache and sends the rest as batch http
+        # requests, returns {message_id: msg_data}
+        cached = self.cache.get_many(message_ids) if self.cache is not None else {}
+        self._count("cached", len(cached))
+        METRICS.incr("cache.hits", len(cached))
+        METRICS.incr("cache.misses", len(message_ids) - len(cached))
+        if len(cached) == len(message_ids):
+            return cached
+
+        fetched = self._fetch_from_api([m for m in message_ids if m not in cached])
+        self._count("fetched", len(fetched))
+        if self.cache is not None:
+            self.cache.put_many(fetched, account=self.account)
+
+        cached.update(fetched)
+        return cached
+
+    def _body_request(self, message_id, service=None):
+        # only the mime tree and part data, the headers already came with the metadata
+        messages = (service or self.service).users().messages()
+        return messages.get(userId="me", id=message_id, format="full", fields=BODY_FIELDS)
+
+    def _fetch_from_api(self, message_ids, make_request=None):
+        batches = [
+            message_ids[start:start + self.batch_size]
+            for start in range(0, len(message_ids), self.batch_size)
+        ]
+
+        results = {}
+        if self.workers > 1 and len(batches) > 1:
+            with self._counts_lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers)
+            for partial in self._pool.map(lambda ids: self._fetch_batch(ids, make_request), batches):
+                results.update(partial)
+        else:
+            for batch_ids in batches:
+                results.update(self._fetch_batch(batch_ids, make_request))
+
+        return results
+
+    def _fetch_batch(self, message_ids, make_request=None):
+        make_request = make_request or self._message_request
+        service = self._thread_service()
+        results = {}
+        failed = []
+
+        def make_callback(message_id):
+            def callback(request_id, response, exception):
+                if exception is None:
+                    results[message_id] = response
+                elif not self._is_missing(message_id, exception):
+                    failed.append(message_id)
+            return callback
+
+        batch = service.new_batch_http_request()
+        for message_id in message_ids:
+            batch.add(make_request(message_id, service), callback=make_callback(message_id))
+
+        try:
+            self._execute(batch, "messages.get", len(message_ids))
+        except HttpError as error:
+            # the whole batch went down, every unanswered item gets retried below
+            print(f"(+_+) batch request failed: {error}")
+            failed.extend(m for m in message_ids if m not in results and m not in failed)
+
+        # retry failed items one by one. anything still failing after the retries is raised,
+        # dropping it here would let the caller save a checkpoint past a message it never stored
+        for message_id in failed:
+            try:
+                results[message_id] = self._execute(make_request(message_id, service), "messages.get")
+            except HttpError as error:
+                if not self._is_missing(message_id, error):
+                    raise
+
+        return results
+
+    def _is_missing(self, message_id, error):
+        # a 404 means the message was deleted after it was listed, the only safe skip
+        if isinstance(error, HttpError) and error.resp.status == 404:
+            print(f"ミ(ノ_ _)ノ message {message_id} is gone, skipping it")
+            METRICS.incr("gmail.missing_messages")
+            return True
+        return False
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if self.cache is not None:
+            self.cache.evict()
+
+    def _process_message(self, message_id, msg_data):
+        headers = msg_data['payload']['headers']
+        subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), 'No Subject')
+        sender = next((h['value'] for h in headers if h['name'].lower() == 'from'), 'Unknown Sender')
+        received_date = datetime.fromtimestamp(int(msg_data['internalDate'])/1000)
+        
+        snippet = msg_data.get("snippet", "")
+        with METRICS.span("classifier.classify"):
+            label = CLASSIFIER.classify(subject, snippet).label
+        METRICS.incr("classifier.messages", label=label or "unrelated")
+        if label is None:
+            # not job related
+            return None
+
+        return {
+            'subject': subject,
+            'sender': sender,
+            'received_date': received_date,
+            'label': label,
+            'message_id': message_id,
+            'snippet': snippet,
+            'account': self.account
+        }
+
+    def iter_message_ids(self, query, page_size=DEFAULT_PAGE_SIZE, limit=None):
+        # lazily follows nextPageToken, only one page of ids is held at a time
+        page_size = max(1, min(page_size, GMAIL_MAX_PAGE_SIZE))
+        page_token = None
+        yielded = 0
+
+        while True:
+            max_results = page_size if limit is None else min(page_size, limit - yielded)
+            if max_results <= 0 or self._cancelled():
+                return
+
+            results = self._execute(
+                self._thread_service().users().messages().list(
+                    userId="me",
+                    maxResults=max_results,
+                    q=query,
+                    pageToken=page_token
+                ),
+                "messages.list",
+            )
+
+            for msg in results.get("messages", []):
+                self._count("listed")
+                yield msg["id"]
+                yielded += 1
+
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                return
+
+    def iter_emails(self, days=30, page_size=DEFAULT_PAGE_SIZE, limit=None):
+        # streaming pipeline: list -> batch fetch -> classify, one batch in memory at a time
         if not self.service:
             raise ValueError("Not authenticated. Call authenticate() first.")
 
         try:
-            date_after = (datetime.now() - timedelta(days=days)).strftime('%Y/%m/%d')
-            query = f'after:{date_after}'
-            
-            results = self.service.users().messages().list(
-                userId="me",
-                maxResults=50,
-                q=query
-            ).execute()
-
-            messages = results.get("messages", [])
-            processed_emails = []
-
-            for msg in messages:
-                try:
-                    msg_data = self.service.users().messages().get(
-                        userId="me", 
-                        id=msg["id"]
-                    ).execute()
-
-                    headers = msg_data['payload']['headers']
-                    subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), 'No Subject')
-                    sender = next((h['value'] for h in headers if h['name'].lower() == 'from'), 'Unknown Sender')
-                    received_date = datetime.fromtimestamp(int(msg_data['internalDate'])/1000)
-                    
-                    snippet = msg_data.get("snippet", "").lower()
-                    subject_lower = subject.lower()
-                    combined_text = f"{subject_lower} {snippet}"
-
-                    # check if the email is job-related
-                    is_job_related = any(keyword.lower() in combined_text for keyword in JOB_RELATED_KEYWORDS)
-                    
-                    if is_job_related:
-                        label = "other"  # default to "other"
-                        for category, keywords in JOB_KEYWORDS.items():
-                            if category != "other" and any(keyword.lower() in combined_text for keyword in keywords):
-                                label = category
-                                break
-
-                        processed_emails.append({
-                            'subject': subject,
-                            'sender': sender,
-                            'received_date': received_date,
-                            'label': label,
-                            'message_id': msg["id"]
-                        })
-
-                except Exception as e:
-                    print(f"error processing message {msg['id']}: {e}")
-                    continue
-
-            return processed_emails
-
+            yield from self._iter_window_emails(days, page_size, limit)
         except HttpError as error:
             print(f"(+_+) error fetching emails: {error}")
-            return []
\ No newline at end of file
+
+    def _iter_window_emails(self, days, page_size, limit=None):
+        date_after = (datetime.now() - timedelta(days=days)).strftime('%Y/%m/%d')
+        yield from self._iter_query_emails(f'after:{date_after}', page_size, limit)
+
+    def iter_range_emails(self, after, before, page_size=GMAIL_MAX_PAGE_SIZE):
+        # job emails received on or after `after` and before `before` (dates), the unit
+        # of work for backfills. safe to run for several ranges from different threads
+        if not self.service:
+            raise ValueError("Not authenticated. Call authenticate() first.")
+
+        query = f"after:{after.strftime('%Y/%m/%d')} before:{before.strftime('%Y/%m/%d')}"
+        yield from self._iter_query_emails(query, page_size)
+
+    def _iter_query_emails(self, query, page_size, limit=None):
+        chunk = []
+        for message_id in self.iter_message_ids(query, page_size=page_size, limit=limit):
+            chunk.append(message_id)
+            if len(chunk) >= self.chunk_size:
+                yield from self._process_chunk(chunk)
+                chunk = []
+
+        if chunk:
+            yield from self._process_chunk(chunk)
+
+    def _process_chunk(self, message_ids):
+        if self._cancelled():
+            return
+
+        if self.known_ids is not None:
+            unknown = self.known_ids.unknown(message_ids)
+            self._count("known", len(message_ids) - len(unknown))
+            METRICS.incr("prefilter.skipped", len(message_ids) - len(unknown))
+            message_ids = unknown
+            if not message_ids:
+                return
+
+        details = self._fetch_message_details(message_ids)
+
+        emails = []
+        for message_id in message_ids:
+            msg_data = details.get(message_id)
+            if msg_data is None:
+                continue
+
+            try:
+                email = self._process_message(message_id, msg_data)
+                if email:
+                    emails.append(email)
+
+            except Exception as e:
+                print(f"error processing message {message_id}: {e}")
+                continue
+
+        if self.body_classify and not self._cancelled():
+            self._refine_labels(emails, details)
+
+        for email in emails:
+            self._count("classified")
+            yield email
+
+    def _refine_labels(self, emails, details):
+        # phase two: only mail that's job related but matched no category is worth a
+        # body download, everything else keeps its metadata label
+        ambiguous = [e for e in emails if e["label"] == CLASSIFIER.default_label]
+        if not ambiguous:
+            return
+        METRICS.incr("classifier.ambiguous", len(ambiguous))
+
+        payloads = {}
+        missing = []
+        for email in ambiguous:
+            payload = details[email["message_id"]].get("payload", {})
+            if has_body(payload):
+                # format=full responses already carry the body
+                payloads[email["message_id"]] = payload
+            else:
+                missing.append(email["message_id"])
+
+        if missing:
+            try:
+                bodies = self._fetch_from_api(missing, make_request=self._body_request)
+            except HttpError as error:
+                # the emails still get stored, just with their metadata label
+                print(f"(+_+) error fetching message bodies: {error}")
+                bodies = {}
+            self._count("bodies", len(bodies))
+            payloads.update((message_id, msg["payload"]) for message_id, msg in bodies.items() if "payload" in msg)
+
+        for email in ambiguous:
+            payload = payloads.get(email["message_id"])
+            if payload is None:
+                continue
+            try:
+                with METRICS.span("classifier.body"):
+                    label = CLASSIFIER.classify(email["subject"], extract_body_text(payload)).label
+            except Exception as e:
+                print(f"error reading the body of message {email['message_id']}: {e}")
+                continue
+
+            if label and label != CLASSIFIER.default_label:
+                email["label"] = label
+                # kept out of `reclassify`, which only sees subject + snippet
+                email["label_source"] = "body"
+                self._count("refined")
+                METRICS.incr("classifier.refined", label=label)
+
+    def refresh_profile(self):
+        # the historyId is read before listing so nothing added mid-sync is missed next time
+        profile = self._execute(
+            self.service.users().getProfile(userId="me"), "getProfile"
+        )
+        self.account = profile["emailAddress"]
+        self.history_id = int(profile["historyId"])
+        return profile
+
+    def iter_history_message_ids(self, start_history_id, page_size=DEFAULT_PAGE_SIZE):
+        # ids of messages added since start_history_id, 404 means the checkpoint expired
+        page_size = max(1, min(page_size, GMAIL_MAX_PAGE_SIZE))
+        page_token = None
+        seen = set()
+
+        while True:
+            results = self._execute(
+                self.service.users().history().list(
+                    userId="me",
+                    startHistoryId=start_history_id,
+                    historyTypes=["messageAdded"],
+                    maxResults=page_size,
+                    pageToken=page_token
+                ),
+                "history.list",
+            )
+
+            for record in results.get("history", []):
+                for added in record.get("messagesAdded", []):
+                    message_id = added["message"]["id"]
+                    if message_id not in seen:
+                        seen.add(message_id)
+                        self._count("listed")
+                        yield message_id
+
+            page_token = results.get("nextPageToken")
+            if not page_token or self._cancelled():
+                return
+
+    def iter_sync_emails(self, start_history_id=None, days=30, page_size=DEFAULT_PAGE_SIZE):
+        # incremental sync from a stored historyId, falls back to the date window scan.
+        # errors propagate so callers never save a checkpoint past unfetched messages
+        if not self.service:
+            raise ValueError("Not authenticated. Call authenticate() first.")
+
+        if self.history_id is None:
+            self.refresh_profile()
+
+        if start_history_id:
+            try:
+                message_ids = list(self.iter_history_message_ids(start_history_id, page_size=page_size))
+            except HttpError as error:
+                if error.resp.status != 404:
+                    raise
+                print("ミ(ノ_ _)ノ history checkpoint expired, falling back to a full scan")
+            else:
+                self.sync_mode = "incremental"
+                for start in range(0, len(message_ids), self.chunk_size):
+                    yield from self._process_chunk(message_ids[start:start + self.chunk_size])
+                return
+
+        self.sync_mode = "window"
+        yield from self._iter_window_emails(days, page_size)
+
+    def iter_cached_emails(self):
+        # replays everything in the local cache through the classifier, no api calls.
+        # each email keeps the account it was cached under, not this manager's
+        if self.cache is None:
+            return
+
+        for account, msg_data in self.cache.iter_messages():
+            try:
+                email = self._process_message(msg_data["id"], msg_data)
+                if email:
+                    email["account"] = account
+                    yield email
+            except Exception as e:
+                print(f"error processing cached message {msg_data['id']}: {e}")
+
+    def fetch_emails(self, days=30, page_size=DEFAULT_PAGE_SIZE, limit=None):
+        return list(self.iter_emails(days=days, page_size=page_size, limit=limit))
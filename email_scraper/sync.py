@@ -0,0 +1,141 @@
+import contextlib
+import multiprocessing
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from email_scraper.database import BULK_INSERT_BATCH_SIZE, DatabaseManager
+from email_scraper.known_ids import KnownMessageIds
+from email_scraper.metrics import METRICS
+from email_scraper.script import GMAIL_BATCH_LIMIT, GmailManager, token_path
+
+
+def run_sync(gmail, db, days=30, incremental=True, batch_size=BULK_INSERT_BATCH_SIZE, on_batch=None, cancel_event=None):
+    # one sync of the authenticated account: checkpoint -> gmail pipeline -> bulk inserts.
+    # returns a run summary dict, errors propagate and leave the checkpoint where it was.
+    # METRICS is reset per run, the summary carries its snapshot under "metrics"
+    started = time.monotonic()
+    METRICS.reset()
+    gmail.reset_sync_counts()
+    gmail.refresh_profile()
+    state = db.get_sync_state(gmail.account) if incremental else None
+    checkpoint = None
+    if state:
+        checkpoint, last_synced = state
+        # if the checkpoint has expired the window scan must reach back to the last sync,
+        # a fixed `days` would leave a gap and the new checkpoint would paper over it
+        days = max(days, (datetime.now(timezone.utc) - last_synced).days + 1)
+
+    # stored ids are skipped before any messages().get, so re-syncing an overlapping
+    # window only costs list calls (plus cache reads for the non-job mail)
+    with METRICS.span("sync.load_known_ids"):
+        gmail.known_ids = KnownMessageIds.load(db)
+
+    gmail.cancel_event = cancel_event
+    emails = gmail.iter_sync_emails(start_history_id=checkpoint, days=days)
+    if cancel_event is not None:
+        emails = _until_cancelled(emails, cancel_event)
+
+    try:
+        with METRICS.span("sync.run"):
+            inserted, skipped = db.insert_emails_bulk(
+                emails, batch_size=batch_size, on_batch=on_batch, on_stored=gmail.known_ids.add_many
+            )
+    finally:
+        gmail.known_ids = None
+        gmail.cancel_event = None
+
+    cancelled = cancel_event is not None and cancel_event.is_set()
+    if not cancelled:
+        # only move the checkpoint once everything up to it is stored
+        db.save_sync_checkpoint(gmail.account, gmail.history_id)
+
+    return {
+        "account": gmail.account,
+        "mode": gmail.sync_mode,
+        "listed": gmail.sync_counts["listed"],
+        "known": gmail.sync_counts["known"],
+        "cached": gmail.sync_counts["cached"],
+        "fetched": gmail.sync_counts["fetched"],
+        "classified": gmail.sync_counts["classified"],
+        "bodies": gmail.sync_counts["bodies"],
+        "refined": gmail.sync_counts["refined"],
+        "inserted": inserted,
+        "duplicates": len(skipped),
+        "cancelled": cancelled,
+        "history_id": gmail.history_id,
+        "duration": round(time.monotonic() - started, 3),
+        "metrics": METRICS.report(),
+    }
+
+
+def _until_cancelled(emails, cancel_event):
+    for email in emails:
+        if cancel_event.is_set():
+            return
+        yield email
+
+
+def sync_accounts(account_names, processes=None, days=30, incremental=True, workers=1,
+                  gmail_batch_size=None, batch_size=BULK_INSERT_BATCH_SIZE):
+    # fans named accounts out over a process pool, one GmailManager + DatabaseManager each.
+    # every account has its own credentials, quota limiter and checkpoint, so a run takes
+    # as long as the slowest account. yields one summary per account as each finishes
+    options = {
+        "days": days,
+        "incremental": incremental,
+        "workers": workers,
+        "gmail_batch_size": gmail_batch_size,
+        "batch_size": batch_size,
+    }
+    processes = max(1, min(processes or len(account_names), len(account_names)))
+    # spawn so children don't inherit the parent's sockets, threads or tk state
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+        futures = {pool.submit(_sync_account, name, options): name for name in account_names}
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                # a crashed child, _sync_account reports ordinary failures itself
+                yield {"account_name": futures[future], "error": str(e)}
+
+
+def _sync_account(account_name, options):
+    # runs in a pool process, stdout is reserved for the parent's json summaries
+    started = time.monotonic()
+    if not os.path.exists(token_path(account_name)):
+        # the browser sign in can't run from a pool process
+        return {"account_name": account_name, "error": "no stored credentials, run the login command first"}
+
+    with contextlib.redirect_stdout(sys.stderr):
+        gmail = GmailManager(
+            batch_size=options["gmail_batch_size"] or GMAIL_BATCH_LIMIT,
+            workers=options["workers"],
+            account_name=account_name,
+        )
+        db = None
+        try:
+            if not gmail.authenticate():
+                return {"account_name": account_name, "error": "failed to authenticate with Gmail"}
+            db = DatabaseManager(max_connections=max(2, options["workers"] + 1))
+            summary = run_sync(
+                gmail,
+                db,
+                days=options["days"],
+                incremental=options["incremental"],
+                batch_size=options["batch_size"],
+            )
+            summary["account_name"] = account_name
+            return summary
+        except Exception as e:
+            return {
+                "account_name": account_name,
+                "error": str(e),
+                "duration": round(time.monotonic() - started, 3),
+            }
+        finally:
+            gmail.close()
+            if db is not None:
+                db.close()
@@ -0,0 +1,60 @@
+import queue
+import threading
+from email_scraper.sync import run_sync
+
+SYNC_INSERT_BATCH_SIZE = 100  # smaller than the bulk default so rows show up sooner
+
+
+class SyncWorker(threading.Thread):
+    # runs a gmail sync off the tk thread and reports back through `events`:
+    #   ("status", text)           progress text for the status bar
+    #   ("rows", [row, ...])       rows committed in the last batch
+    #   ("auth_error", text)
+    #   ("error", text)
+    #   ("cancelled", inserted)
+    #   ("done", inserted)
+    def __init__(self, gmail, db, days=30, batch_size=SYNC_INSERT_BATCH_SIZE):
+        super().__init__(daemon=True)
+        self.gmail = gmail
+        self.db = db
+        self.days = days
+        self.batch_size = batch_size
+        self.events = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.inserted = 0
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def _on_batch(self, rows):
+        self.inserted += len(rows)
+        self.events.put(("rows", rows))
+        processed = self.gmail.sync_counts["classified"]
+        self.events.put(("status", f"synced {processed} emails, {self.inserted} new"))
+
+    def run(self):
+        try:
+            self.events.put(("status", "authenticating..."))
+            if not self.gmail.service and not self.gmail.authenticate():
+                self.events.put(("auth_error", "failed to authenticate with Gmail"))
+                return
+
+            self.events.put(("status", "syncing..."))
+            summary = run_sync(
+                self.gmail,
+                self.db,
+                days=self.days,
+                batch_size=self.batch_size,
+                on_batch=self._on_batch,
+                cancel_event=self.cancel_event,
+            )
+
+            # a cancelled sync leaves the checkpoint put so the next one picks up what was skipped
+            self.events.put(("cancelled" if summary["cancelled"] else "done", summary["inserted"]))
+
+        except Exception as e:
+            self.events.put(("error", str(e)))